@@ -4,17 +4,53 @@ Workout Log Manager — Flask API (Solo Project 3)
 Production version with PostgreSQL persistence, images, paging, search, and sorting.
 """
 
+import atexit
+import json
+import logging
 import os
+import queue
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta, timezone
 
-from flask import Flask, request, jsonify
+import click
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-
-from db import init_db, with_connection
+from psycopg2.extras import Json, execute_values
+
+from changefeed import ChangeFeed, TooManySubscribers
+from db import close_pool, init_db, warm_pool, with_connection, with_direct_connection
+from jobs import (
+    FINISHED_STATUSES,
+    JobFailed,
+    cancel_job,
+    enqueue_job,
+    get_job,
+    job_handler,
+    job_kinds,
+    run_workers,
+)
+from serializers import (
+    INSERT_COLUMNS,
+    MSGPACK_MIMETYPE,
+    WORKOUT_COLUMNS,
+    WORKOUT_FIELDS,
+    encode_workouts,
+    row_to_fields,
+    row_to_workout,
+    select_columns,
+    to_msgpack,
+    workout_params,
+)
+from singleflight import SingleFlight, make_key
+from write_queue import WriteQueue
 
 app = Flask(__name__, static_folder="../public", static_url_path="")
 CORS(app)
 
+logger = logging.getLogger(__name__)
+
 
 # Paging configuration for Solo Project 3
 PAGE_SIZE_DEFAULT = 10
@@ -25,6 +61,46 @@ PAGE_SIZE_MAX = 50
 EXERCISE_TYPES = {"Cardio", "Strength Training", "Yoga", "HIIT", "Sports", "Flexibility", "Other"}
 INTENSITIES = {"Low", "Medium", "High"}
 
+# Server-sent events: keepalive comment interval and client reconnect delay
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_RETRY_MS = 3000
+# On the main (threaded) service every open stream holds one of the worker's
+# request threads, so cap them well below the thread count (see
+# gunicorn.conf.py) to keep threads free for ordinary API calls. The stream
+# service (gunicorn_stream.conf.py) runs gevent workers and raises the cap
+# into the thousands. Rejected clients are told to retry after this long.
+STREAM_MAX_PER_WORKER = int(
+    os.environ.get("STREAM_MAX_PER_WORKER", max(1, int(os.environ.get("GUNICORN_THREADS", 16)) // 4))
+)
+STREAM_BUSY_RETRY_MS = 30000
+
+# Optional group-commit write path for POST /api/workouts (see write_queue.py)
+WRITE_QUEUE_ENABLED = os.environ.get("WRITE_QUEUE_ENABLED") == "1"
+WRITE_QUEUE_FLUSH_MS = int(os.environ.get("WRITE_QUEUE_FLUSH_MS", 2))
+WRITE_QUEUE_MAX_ROWS = int(os.environ.get("WRITE_QUEUE_MAX_ROWS", 200))
+WRITE_QUEUE_ACK_TIMEOUT_SECONDS = 30
+
+# Delta sync (/api/workouts/changes) page size
+CHANGES_LIMIT_DEFAULT = 200
+CHANGES_LIMIT_MAX = 1000
+# Sync token parts are Postgres txids and ids, i.e. BIGINT
+SYNC_TOKEN_PART_MAX = 2**63 - 1
+
+# Background jobs: rows per import INSERT / export fetch, and retry cap
+JOB_BATCH_ROWS = 500
+JOB_MAX_ATTEMPTS_LIMIT = 10
+# A stats report is one query with no progress along the way, so it gets a
+# longer stale window (see jobs.py) and a statement timeout that ends it a
+# minute before that window would let another worker take the job back.
+JOB_STATS_REPORT_STALE_SECONDS = 30 * 60
+JOB_STATS_REPORT_TIMEOUT_MS = (JOB_STATS_REPORT_STALE_SECONDS - 60) * 1000
+
+# Warm-up retries while the database is unreachable (e.g. still waking up)
+WARM_UP_RETRY_SECONDS = 2
+
+# Layouts for the workouts array in list/dashboard responses (see serializers.py)
+RESPONSE_FORMATS = {"rows", "columnar"}
+
 # Valid sort columns exposed to the client
 SORT_COLUMNS = {
     "date": "workout_date",
@@ -33,35 +109,6 @@ SORT_COLUMNS = {
 }
 
 
-def row_to_workout(row):
-    """
-    Convert a DB row from `workouts` into the JSON shape used by the frontend.
-    Expected row order:
-    (id, workout_date, exercise_type, duration_min, intensity, calories_burned, notes, image_url)
-    """
-    (
-        wid,
-        workout_date,
-        exercise_type,
-        duration_min,
-        intensity,
-        calories_burned,
-        notes,
-        image_url,
-    ) = row
-
-    return {
-        "id": wid,
-        "date": workout_date.isoformat(),
-        "exerciseType": exercise_type,
-        "duration": duration_min,
-        "intensity": intensity,
-        "caloriesBurned": calories_burned,
-        "notes": notes or "",
-        "imageUrl": image_url,
-    }
-
-
 def validate_workout(body, for_update=False):
     """Server-side validation. Returns (None, error_response) or (workout_dict, None)."""
     if not isinstance(body, dict):
@@ -126,7 +173,8 @@ def validate_workout(body, for_update=False):
 def seed_db_if_needed():
     """
     Ensure the workouts table has at least 30 records.
-    This is run on startup and is safe to call multiple times.
+    This is run on startup and is safe to call multiple times. It uses its own
+    connection rather than the pool, which is only opened in worker processes.
     """
 
     def _inner(conn):
@@ -178,48 +226,139 @@ def seed_db_if_needed():
                 )
 
             cur.executemany(
-                """
-                INSERT INTO workouts (
-                    workout_date,
-                    exercise_type,
-                    duration_min,
-                    intensity,
-                    calories_burned,
-                    notes,
-                    image_url
-                )
+                f"""
+                INSERT INTO workouts ({INSERT_COLUMNS})
                 VALUES (%s, %s, %s, %s, %s, %s, %s);
                 """,
                 rows,
             )
 
-    with_connection(_inner)
+    with_direct_connection(_inner)
 
 
-# Initialize database schema and seed data at startup
+# Initialize database schema and seed data at startup. Neither touches the
+# pool, so under gunicorn's preload_app the master holds no connections and
+# each worker opens its own pool after the fork (see warm_up below).
 init_db()
 seed_db_if_needed()
 
+# Identical concurrent reads (list pages, dashboard, stats) share one query
+read_coalescer = SingleFlight()
+
+# One LISTEN connection per process, shared by every /api/workouts/stream
+# client. Every notification also bumps the read epoch, so writes committed by
+# other workers and the jobs worker stop this process sharing older reads.
+change_feed = ChangeFeed(
+    "workout_changes",
+    max_subscribers=STREAM_MAX_PER_WORKER,
+    on_change=read_coalescer.bump_epoch,
+)
+
+write_queue = WriteQueue(
+    row_to_workout,
+    flush_ms=WRITE_QUEUE_FLUSH_MS,
+    max_rows=WRITE_QUEUE_MAX_ROWS,
+    on_commit=read_coalescer.bump_epoch,
+)
+# Flush queued writes on a normal interpreter exit (flask run, jobs-worker).
+# gunicorn.conf.py also calls stop() from worker_exit; a second call is a no-op.
+atexit.register(write_queue.stop)
+
 
 @app.route("/api/health")
 def health():
+    """Liveness: the process is up. See /api/ready for readiness."""
     return jsonify({"status": "ok"})
 
 
-@app.route("/api/workouts", methods=["GET"])
-def list_workouts():
+@app.route("/api/ready")
+def ready():
     """
-    List workouts with paging, optional search/filtering, and sorting.
+    Readiness: 200 once this worker has finished warming up, 503 until then.
+    Point load balancer / platform health checks here rather than /api/health.
+    """
+    start_warm_up()
+    if not warm_up_done.is_set():
+        return jsonify({"status": "warming"}), 503
+    return jsonify({"status": "ready"})
 
-    Query params:
-      - page: 1-based page number
-      - pageSize: number of records per page (5–50)
+
+def parse_filter_params(source=None):
+    """
+    Read the search/filter params shared by the list, dashboard, and stats
+    endpoints (and export jobs, which pass their payload as `source`).
+    Returns (None, error_response) or (filters_dict, None).
+
+    Params:
       - search: substring search on exercise type and notes
       - exerciseType: exact match filter
       - intensity: exact match filter
-      - sortBy: one of "date", "duration", "calories"
-      - sortDir: "asc" or "desc"
+      - dateFrom / dateTo: inclusive date bounds (YYYY-MM-DD)
+    """
+    if source is None:
+        source = request.args
+
+    def _param(name):
+        return str(source.get(name) or "").strip()
+
+    filters = {
+        # Lower-cased here (the query compares lower-case anyway) so searches
+        # that differ only in case coalesce to the same read.
+        "search": _param("search").lower(),
+        "exerciseType": _param("exerciseType"),
+        "intensity": _param("intensity"),
+        "dateFrom": None,
+        "dateTo": None,
+    }
+
+    for name in ("dateFrom", "dateTo"):
+        value = _param(name)
+        if not value:
+            continue
+        try:
+            filters[name] = datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            return None, ({"error": f"{name} must be in YYYY-MM-DD format."}, 400)
+
+    return filters, None
+
+
+def parse_fields():
     """
+    Read the `fields` query param (comma-separated API field names) for sparse
+    projection. Returns (None, error_response) or (fields_tuple, None).
+
+    Fields come back in WORKOUT_FIELDS order whatever order they were asked
+    in, so equivalent requests share one query shape; `id` is always included.
+    """
+    raw = request.args.get("fields", "", type=str).strip()
+    if not raw:
+        return WORKOUT_FIELDS, None
+
+    requested = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = sorted(requested - set(WORKOUT_FIELDS))
+    if unknown:
+        return None, (
+            {
+                "error": f"Unknown field(s): {', '.join(unknown)}. "
+                f"Allowed: {', '.join(WORKOUT_FIELDS)}."
+            },
+            400,
+        )
+    requested.add("id")
+    return tuple(f for f in WORKOUT_FIELDS if f in requested), None
+
+
+def parse_list_params():
+    """
+    Read the paging, filter, and sort query params shared by `/api/workouts`
+    and `/api/dashboard`, clamping paging to safe values.
+    Returns (None, error_response) or (query_dict, None).
+    """
+    query, err = parse_filter_params()
+    if err:
+        return None, err
+
     page = request.args.get("page", 1, type=int)
     if page is None or page < 1:
         page = 1
@@ -230,103 +369,578 @@ def list_workouts():
     if page_size > PAGE_SIZE_MAX:
         page_size = PAGE_SIZE_MAX
 
-    search = request.args.get("search", "", type=str).strip()
-    exercise_type_filter = request.args.get("exerciseType", "", type=str).strip()
-    intensity_filter = request.args.get("intensity", "", type=str).strip()
+    fields, err = parse_fields()
+    if err:
+        return None, err
 
     sort_by_param = request.args.get("sortBy", "date")
     sort_dir_param = request.args.get("sortDir", "desc")
 
-    sort_column = SORT_COLUMNS.get(sort_by_param, SORT_COLUMNS["date"])
-    sort_dir = "ASC" if str(sort_dir_param).lower() == "asc" else "DESC"
+    query.update(
+        {
+            "fields": fields,
+            "page": page,
+            "pageSize": page_size,
+            "sortColumn": SORT_COLUMNS.get(sort_by_param, SORT_COLUMNS["date"]),
+            "sortDir": "ASC" if str(sort_dir_param).lower() == "asc" else "DESC",
+        }
+    )
+    return query, None
 
-    def _inner(conn):
-        where_clauses = []
-        params = []
 
-        if search:
-            where_clauses.append(
-                "(LOWER(exercise_type) LIKE %s OR LOWER(COALESCE(notes, '')) LIKE %s)"
-            )
-            like = f"%{search.lower()}%"
-            params.extend([like, like])
+def build_where(query):
+    """Build the WHERE clause and its params for the search/filter values in `query`."""
+    where_clauses = []
+    params = []
+
+    if query["search"]:
+        where_clauses.append(
+            "(LOWER(exercise_type) LIKE %s OR LOWER(COALESCE(notes, '')) LIKE %s)"
+        )
+        like = f"%{query['search'].lower()}%"
+        params.extend([like, like])
+
+    if query["exerciseType"]:
+        where_clauses.append("exercise_type = %s")
+        params.append(query["exerciseType"])
+
+    if query["intensity"]:
+        where_clauses.append("intensity = %s")
+        params.append(query["intensity"])
+
+    if query["dateFrom"]:
+        where_clauses.append("workout_date >= %s")
+        params.append(query["dateFrom"])
+
+    if query["dateTo"]:
+        where_clauses.append("workout_date <= %s")
+        params.append(query["dateTo"])
+
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    return where_sql, params
+
+
+def parse_format():
+    """Read the `format` query param. Returns (None, error_response) or (format, None)."""
+    fmt = request.args.get("format", "rows", type=str).strip().lower()
+    if fmt not in RESPONSE_FORMATS:
+        return None, ({"error": "format must be 'rows' or 'columnar'."}, 400)
+    return fmt, None
+
+
+def respond(payload, status=200):
+    """
+    Send `payload` as MessagePack if the client asks for it with
+    `Accept: application/msgpack`, otherwise as JSON.
+    """
+    best = request.accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE])
+    if best == MSGPACK_MIMETYPE:
+        response = Response(to_msgpack(payload), status=status, mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.vary.add("Accept")
+    return response
+
+
+def shared_read(shape, params, fn):
+    """
+    Run a read through the coalescer, unless the client asked for `fresh=1`
+    (e.g. right after its own write, which another worker may have served;
+    see singleflight.py).
+    """
+    if request.args.get("fresh") == "1":
+        return fn()
+    return read_coalescer.do(make_key(shape, params), fn)
+
+
+def fetch_workout_page(cur, query):
+    """
+    Fetch one page of workouts plus the total match count.
+
+    The count comes from a `COUNT(*) OVER()` window on the page query itself,
+    so the common case is a single round trip. Only when the requested page is
+    past the end (no rows come back) do we count separately and re-fetch the
+    last page.
+
+    Only the columns for `query["fields"]` are selected. Returns
+    (rows, total, page, total_pages), with rows as raw cursor tuples holding
+    those fields in order, so callers can pick the output encoding.
+    """
+    where_sql, params = build_where(query)
+    page_size = query["pageSize"]
+    page_sql = f"""
+        SELECT
+            {select_columns(query["fields"])},
+            COUNT(*) OVER() AS total
+        FROM workouts
+        {where_sql}
+        ORDER BY {query["sortColumn"]} {query["sortDir"]}
+        LIMIT %s OFFSET %s;
+    """
+
+    page = query["page"]
+    cur.execute(page_sql, params + [page_size, (page - 1) * page_size])
+    rows = cur.fetchall()
+
+    if rows:
+        total = rows[0][-1]
+    else:
+        if page == 1:
+            return [], 0, 1, 1
+        # Requested page is past the end; clamp to the last page.
+        cur.execute(f"SELECT COUNT(*) FROM workouts {where_sql};", params)
+        total = cur.fetchone()[0]
+        if total == 0:
+            return [], 0, 1, 1
+        page = (total + page_size - 1) // page_size
+        cur.execute(page_sql, params + [page_size, (page - 1) * page_size])
+        rows = cur.fetchall()
+
+    total_pages = (total + page_size - 1) // page_size
+    return [r[:-1] for r in rows], total, page, total_pages
+
+
+def _summarize_group(count, minutes, calories, avg_dur, avg_cal, p50_dur, p90_dur, p50_cal, p90_cal):
+    """Shape one GROUPING SETS row into the per-group stats dict."""
 
-        if exercise_type_filter:
-            where_clauses.append("exercise_type = %s")
-            params.append(exercise_type_filter)
+    def _round(value):
+        return round(value) if value is not None else 0
 
-        if intensity_filter:
-            where_clauses.append("intensity = %s")
-            params.append(intensity_filter)
+    return {
+        "count": count,
+        "totalMinutes": int(minutes or 0),
+        "totalCalories": int(calories or 0),
+        "avgDuration": _round(avg_dur),
+        "avgCalories": _round(avg_cal),
+        "medianDuration": _round(p50_dur),
+        "p90Duration": _round(p90_dur),
+        "medianCalories": _round(p50_cal),
+        "p90Calories": _round(p90_cal),
+    }
+
+
+def fetch_stats(cur, filters):
+    """
+    Aggregate statistics for the workouts matching `filters`: overall totals,
+    averages and percentiles, plus the same broken down by exercise type and
+    by intensity.
+
+    All three levels come from one scan via GROUPING SETS; GROUPING() tells
+    the overall row and the two kinds of breakdown rows apart.
+    """
+    where_sql, params = build_where(filters)
+    cur.execute(
+        f"""
+        SELECT
+            GROUPING(exercise_type) AS type_rolled_up,
+            GROUPING(intensity) AS intensity_rolled_up,
+            exercise_type,
+            intensity,
+            COUNT(*),
+            SUM(duration_min),
+            SUM(calories_burned),
+            AVG(duration_min),
+            AVG(calories_burned),
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY duration_min),
+            PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY duration_min),
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY calories_burned),
+            PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY calories_burned)
+        FROM workouts
+        {where_sql}
+        GROUP BY GROUPING SETS ((), (exercise_type), (intensity));
+        """,
+        params,
+    )
+
+    overall = _summarize_group(0, 0, 0, None, None, None, None, None, None)
+    by_type = []
+    by_intensity = []
+    for row in cur.fetchall():
+        type_rolled_up, intensity_rolled_up, exercise_type, intensity = row[:4]
+        group = _summarize_group(*row[4:])
+        if type_rolled_up and intensity_rolled_up:
+            overall = group
+        elif intensity_rolled_up:
+            by_type.append({"exerciseType": exercise_type, **group})
+        else:
+            by_intensity.append({"intensity": intensity, **group})
+
+    by_type.sort(key=lambda g: (-g["count"], g["exerciseType"]))
+    intensity_order = ["Low", "Medium", "High"]
+    by_intensity.sort(
+        key=lambda g: intensity_order.index(g["intensity"])
+        if g["intensity"] in intensity_order
+        else len(intensity_order)
+    )
+
+    return {
+        "totalWorkouts": overall["count"],
+        "totalMinutes": overall["totalMinutes"],
+        "totalCalories": overall["totalCalories"],
+        "avgDuration": overall["avgDuration"],
+        "avgCalories": overall["avgCalories"],
+        "medianDuration": overall["medianDuration"],
+        "p90Duration": overall["p90Duration"],
+        "medianCalories": overall["medianCalories"],
+        "p90Calories": overall["p90Calories"],
+        "mostCommonType": by_type[0]["exerciseType"] if by_type else "N/A",
+        "byExerciseType": by_type,
+        "byIntensity": by_intensity,
+        "defaultPageSize": PAGE_SIZE_DEFAULT,
+    }
+
+
+def fetch_dashboard_stats(cur):
+    """
+    The dashboard's summary numbers across all workouts: totals, averages and
+    the most common type, plus the per-type counts behind it so clients can
+    keep these up to date from change events.
+
+    Runs on every dashboard load, so it leaves out the percentiles and
+    breakdowns `fetch_stats` computes. One hash-aggregated pass grouped by
+    exercise type gives the per-type counts and sums, and the totals are added
+    up from those few rows (about 30 ms at 200k workouts, against about 200 ms
+    for the full `fetch_stats`).
+    """
+    cur.execute(
+        """
+        SELECT exercise_type, COUNT(*), SUM(duration_min), SUM(calories_burned)
+        FROM workouts
+        GROUP BY exercise_type;
+        """
+    )
+    rows = cur.fetchall()
+    total_workouts = sum(row[1] for row in rows)
+    total_minutes = sum(int(row[2] or 0) for row in rows)
+    total_calories = sum(int(row[3] or 0) for row in rows)
+    most_common = min(rows, key=lambda row: (-row[1], row[0]), default=None)
 
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    return {
+        "totalWorkouts": total_workouts,
+        "totalMinutes": total_minutes,
+        "totalCalories": total_calories,
+        "avgDuration": round(total_minutes / total_workouts) if total_workouts else 0,
+        "avgCalories": round(total_calories / total_workouts) if total_workouts else 0,
+        "mostCommonType": most_common[0] if most_common else "N/A",
+        "exerciseTypeCounts": {row[0]: row[1] for row in rows},
+        "defaultPageSize": PAGE_SIZE_DEFAULT,
+    }
+
+
+@app.route("/api/workouts", methods=["GET"])
+def list_workouts():
+    """
+    List workouts with paging, optional search/filtering, and sorting.
+
+    Query params:
+      - page: 1-based page number
+      - pageSize: number of records per page (5–50)
+      - search: substring search on exercise type and notes
+      - exerciseType: exact match filter
+      - intensity: exact match filter
+      - dateFrom / dateTo: inclusive date bounds (YYYY-MM-DD)
+      - sortBy: one of "date", "duration", "calories"
+      - sortDir: "asc" or "desc"
+      - format: "rows" (default, one object per workout) or "columnar"
+        (`workouts` is an object with one array per field)
+      - fields: comma-separated subset of id, date, exerciseType, duration,
+        intensity, caloriesBurned, notes, imageUrl (default: all; id is
+        always included)
+      - fresh: "1" to skip read coalescing, so the response reflects writes
+        this client just made (see singleflight.py)
+
+    Send `Accept: application/msgpack` for a MessagePack body instead of JSON.
+    """
+    query, err = parse_list_params()
+    if err:
+        return jsonify(err[0]), err[1]
+    fmt, err = parse_format()
+    if err:
+        return jsonify(err[0]), err[1]
 
+    def _inner(conn):
         with conn.cursor() as cur:
-            # Total count
-            cur.execute(f"SELECT COUNT(*) FROM workouts {where_sql};", params)
-            total = cur.fetchone()[0]
+            return fetch_workout_page(cur, query)
 
-            if total == 0:
-                return [], 0, 1, 1
+    rows, total, page_effective, total_pages = shared_read(
+        "list_workouts", query, lambda: with_connection(_inner)
+    )
 
-            total_pages = (total + page_size - 1) // page_size
-            if page > total_pages:
-                page_local = total_pages
-            else:
-                page_local = page
+    return respond(
+        {
+            "workouts": encode_workouts(rows, fmt, query["fields"]),
+            "total": total,
+            "page": page_effective,
+            "pageSize": query["pageSize"],
+            "totalPages": total_pages,
+        }
+    )
 
-            offset = (page_local - 1) * page_size
 
-            cur.execute(
-                f"""
-                SELECT
-                    id,
-                    workout_date,
-                    exercise_type,
-                    duration_min,
-                    intensity,
-                    calories_burned,
-                    notes,
-                    image_url
-                FROM workouts
-                {where_sql}
-                ORDER BY {sort_column} {sort_dir}
-                LIMIT %s OFFSET %s;
-                """,
-                params + [page_size, offset],
-            )
-            rows = cur.fetchall()
-            workouts = [row_to_workout(r) for r in rows]
-            return workouts, total, page_local, total_pages
+@app.route("/api/dashboard", methods=["GET"])
+def dashboard():
+    """
+    One round trip for the main view: the requested page of workouts, its
+    paging info, and the summary stats.
+
+    Takes the same query params (and `format` / Accept negotiation) as
+    `/api/workouts`. The filters apply to the page only; the stats panel
+    always covers every workout (see `fetch_dashboard_stats`), and
+    `/api/stats` serves filtered stats with breakdowns and percentiles.
+    Everything is read on one connection inside a REPEATABLE READ
+    transaction, so the page, the total, and the stats all come from the
+    same snapshot.
+    """
+    query, err = parse_list_params()
+    if err:
+        return jsonify(err[0]), err[1]
+    fmt, err = parse_format()
+    if err:
+        return jsonify(err[0]), err[1]
 
-    workouts, total, page_effective, total_pages = with_connection(_inner)
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+            page_data = fetch_workout_page(cur, query)
+            return page_data, fetch_dashboard_stats(cur)
 
-    return jsonify(
+    (rows, total, page_effective, total_pages), stats_data = shared_read(
+        "dashboard", query, lambda: with_connection(_inner)
+    )
+    return respond(
         {
-            "workouts": workouts,
+            "workouts": encode_workouts(rows, fmt, query["fields"]),
             "total": total,
             "page": page_effective,
-            "pageSize": page_size,
+            "pageSize": query["pageSize"],
             "totalPages": total_pages,
+            "stats": stats_data,
         }
     )
 
 
+def parse_sync_token(token):
+    """
+    Decode a delta-sync token. Returns (floor, cursor, next_floor) or None if
+    the token is malformed.
+
+    Tokens are either "<floor>" (between passes) or
+    "<floor>.<cursor_xid>.<cursor_id>.<next_floor>" (mid-pass, more pages to
+    come). Clients should treat them as opaque.
+    """
+    parts = token.split(".")
+    if len(parts) not in (1, 4) or not all(p.isascii() and p.isdigit() for p in parts):
+        return None
+    numbers = [int(p) for p in parts]
+    if any(n > SYNC_TOKEN_PART_MAX for n in numbers):
+        return None
+    if len(numbers) == 1:
+        return numbers[0], None, None
+    return numbers[0], (numbers[1], numbers[2]), numbers[3]
+
+
+def fetch_changes(cur, floor, cursor, next_floor, limit, include_deletes):
+    """
+    Read one page of changes for delta sync.
+
+    A "pass" returns every row and tombstone stamped with a transaction id
+    >= `floor`, in (change_xid, id) order so it can be paged by keyset. At the
+    start of a pass we record the oldest transaction still running; when the
+    pass ends, that becomes the next floor. Anything uncommitted during the
+    pass has an id at or above it, so the next pass picks it up. The cost is
+    that rows changed during the pass can be sent twice, which is harmless
+    for clients that apply changes as upserts and deletes.
+
+    The floor can only advance past transactions that have finished, so one
+    long-running write transaction (or a session left idle in transaction
+    after writing) pins it until it ends. Clients still get correct results,
+    but every sync re-sends everything changed since that transaction began.
+    Keep writes in short transactions; background jobs commit per batch for
+    this reason.
+
+    Returns (changes, next_token, has_more).
+    """
+    if next_floor is None:
+        cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot());")
+        next_floor = cur.fetchone()[0]
+    cursor_xid, cursor_id = cursor or (-1, -1)
+    params = (floor, cursor_xid, cursor_id, limit + 1)
+
+    cur.execute(
+        """
+        SELECT
+            change_xid,
+            id,
+            workout_date,
+            exercise_type,
+            duration_min,
+            intensity,
+            calories_burned,
+            notes,
+            image_url,
+            updated_at
+        FROM workouts
+        WHERE change_xid >= %s AND (change_xid, id) > (%s, %s)
+        ORDER BY change_xid, id
+        LIMIT %s;
+        """,
+        params,
+    )
+    entries = []
+    for row in cur.fetchall():
+        workout = row_to_workout(row[1:9])
+        workout["updatedAt"] = row[9].isoformat()
+        entries.append((row[0], row[1], {"op": "upsert", "id": row[1], "workout": workout}))
+
+    if include_deletes:
+        cur.execute(
+            """
+            SELECT change_xid, workout_id, deleted_at
+            FROM workout_tombstones
+            WHERE change_xid >= %s AND (change_xid, workout_id) > (%s, %s)
+            ORDER BY change_xid, workout_id
+            LIMIT %s;
+            """,
+            params,
+        )
+        for change_xid, wid, deleted_at in cur.fetchall():
+            entries.append(
+                (change_xid, wid, {"op": "delete", "id": wid, "deletedAt": deleted_at.isoformat()})
+            )
+
+    entries.sort(key=lambda e: (e[0], e[1]))
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    if has_more:
+        last_xid, last_id, _ = entries[-1]
+        next_token = f"{floor}.{last_xid}.{last_id}.{next_floor}"
+    else:
+        next_token = str(next_floor)
+    return [e[2] for e in entries], next_token, has_more
+
+
+@app.route("/api/workouts/changes", methods=["GET"])
+def workout_changes():
+    """
+    Incremental sync: everything created, updated, or deleted since a token.
+
+    Query params:
+      - since: token from a previous response; omit for a full initial sync
+      - limit: max changes per response (1–1000, default 200)
+
+    Response:
+      {"changes": [{"op": "upsert", "id": 7, "workout": {...}},
+                   {"op": "delete", "id": 9, "deletedAt": "..."}],
+       "nextToken": "...", "hasMore": true | false}
+
+    Keep requesting with `nextToken` while `hasMore` is true, then store it for
+    the next sync. A change can occasionally appear twice; apply changes as
+    upserts/deletes by id.
+    """
+    since = request.args.get("since", "", type=str).strip()
+    if since:
+        decoded = parse_sync_token(since)
+        if decoded is None:
+            return jsonify({"error": "Invalid sync token."}), 400
+        floor, cursor, next_floor = decoded
+    else:
+        floor, cursor, next_floor = 0, None, None
+
+    limit = request.args.get("limit", CHANGES_LIMIT_DEFAULT, type=int)
+    if limit is None or limit < 1:
+        limit = 1
+    if limit > CHANGES_LIMIT_MAX:
+        limit = CHANGES_LIMIT_MAX
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+            # A full sync (floor 0) starts from nothing, so it has nothing to delete.
+            return fetch_changes(cur, floor, cursor, next_floor, limit, include_deletes=floor > 0)
+
+    changes, next_token, has_more = with_connection(_inner)
+    return jsonify({"changes": changes, "nextToken": next_token, "hasMore": has_more})
+
+
+@app.route("/api/workouts/stream", methods=["GET"])
+def stream_workouts():
+    """
+    Server-sent events feed of workout changes.
+
+    Each `change` event carries a compact delta:
+      {"seq": 42, "op": "insert" | "update" | "delete", "id": 7, "row": {...}}
+    where `row` has the same shape as the list endpoint (for deletes, it is
+    the row as it was before the delete).
+
+    A `reset` event means the client may have missed changes (it reconnected
+    too late to resume, or fell too far behind) and should reload its page.
+    Browsers resume automatically via the Last-Event-ID header.
+
+    Each stream occupies a request thread on the threaded main service, or a
+    greenlet on the gevent stream service, and a worker serves at most
+    STREAM_MAX_PER_WORKER of them; past that it answers 503 with a Retry-After
+    header and a `retry:` hint, and the client should try again later.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    try:
+        sub = change_feed.subscribe(last_event_id)
+    except TooManySubscribers:
+        return Response(
+            f"retry: {STREAM_BUSY_RETRY_MS}\n\n",
+            status=503,
+            mimetype="text/event-stream",
+            headers={"Retry-After": str(STREAM_BUSY_RETRY_MS // 1000)},
+        )
+
+    def format_event(event_id, data):
+        return f"id: {event_id}\nevent: change\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            for event_id, data in sub.replay:
+                yield format_event(event_id, data)
+            sub.replay = []
+            while True:
+                if sub.reset:
+                    sub.reset = False
+                    # Anything already queued is superseded by the reload.
+                    while not sub.events.empty():
+                        sub.events.get_nowait()
+                    yield "event: reset\ndata: {}\n\n"
+                try:
+                    event = sub.events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Woken by mark_reset(); the check at the top handles it.
+                    continue
+                yield format_event(*event)
+        finally:
+            change_feed.unsubscribe(sub)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/api/workouts/<int:wid>", methods=["GET"])
 def get_workout(wid):
+    """Fetch one workout. Accepts the same `fields` param as the list endpoint."""
+    fields, err = parse_fields()
+    if err:
+        return jsonify(err[0]), err[1]
+
     def _inner(conn):
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT
-                    id,
-                    workout_date,
-                    exercise_type,
-                    duration_min,
-                    intensity,
-                    calories_burned,
-                    notes,
-                    image_url
+                f"""
+                SELECT {select_columns(fields)}
                 FROM workouts
                 WHERE id = %s;
                 """,
@@ -335,62 +949,109 @@ def get_workout(wid):
             row = cur.fetchone()
             if not row:
                 return None
-            return row_to_workout(row)
+            return row_to_fields(row, fields)
 
     workout = with_connection(_inner)
     if not workout:
         return jsonify({"error": "Workout not found."}), 404
-    return jsonify(workout)
+    return respond(workout)
 
 
 @app.route("/api/workouts", methods=["POST"])
 def create_workout():
+    """
+    Create a workout.
+
+    When WRITE_QUEUE_ENABLED=1, inserts go through the group-commit queue and
+    the `ack` query param picks the acknowledgement:
+      - ack=commit (default): wait for the batch commit, respond 201 with the
+        row (same durability as a direct insert)
+      - ack=pending: respond 202 right away with a `pendingId`; a graceful
+        shutdown flushes the queue first, but the row is lost if this process
+        crashes or is killed before the batch flushes
+    If the queue is full or shutting down, the request falls back to a direct insert. If the
+    batch fails or doesn't commit within WRITE_QUEUE_ACK_TIMEOUT_SECONDS, the
+    response is a 503 that still carries the `pendingId`, so the client can
+    check the outcome rather than blindly retrying.
+    """
     body = request.get_json(silent=True)
     workout, err = validate_workout(body or {}, for_update=False)
     if err:
         return jsonify(err[0]), err[1]
 
+    if WRITE_QUEUE_ENABLED:
+        try:
+            pending = write_queue.submit(workout)
+        except queue.Full:
+            pending = None
+        if pending is not None:
+            if request.args.get("ack") == "pending":
+                return jsonify({"pendingId": pending.pending_id, "status": "pending"}), 202
+            try:
+                created = pending.future.result(timeout=WRITE_QUEUE_ACK_TIMEOUT_SECONDS)
+            except FutureTimeoutError:
+                return (
+                    jsonify(
+                        {
+                            "error": "Workout was queued but not committed in time.",
+                            "pendingId": pending.pending_id,
+                            "status": "pending",
+                        }
+                    ),
+                    503,
+                )
+            except RuntimeError as exc:
+                return (
+                    jsonify({"error": str(exc), "pendingId": pending.pending_id, "status": "failed"}),
+                    503,
+                )
+            return jsonify(created), 201
+
     def _inner(conn):
         with conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO workouts (
-                    workout_date,
-                    exercise_type,
-                    duration_min,
-                    intensity,
-                    calories_burned,
-                    notes,
-                    image_url
-                )
+                f"""
+                INSERT INTO workouts ({INSERT_COLUMNS})
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING
-                    id,
-                    workout_date,
-                    exercise_type,
-                    duration_min,
-                    intensity,
-                    calories_burned,
-                    notes,
-                    image_url;
+                RETURNING {WORKOUT_COLUMNS};
                 """,
-                (
-                    workout["date"],
-                    workout["exerciseType"],
-                    workout["duration"],
-                    workout["intensity"],
-                    workout["caloriesBurned"],
-                    workout["notes"],
-                    workout["imageUrl"],
-                ),
+                workout_params(workout),
             )
             row = cur.fetchone()
             return row_to_workout(row)
 
     created = with_connection(_inner)
+    read_coalescer.bump_epoch()
     return jsonify(created), 201
 
 
+@app.route("/api/workouts/pending/<pending_id>", methods=["GET"])
+def get_pending_workout(pending_id):
+    """
+    Status of a write accepted with ack=pending.
+
+    Outcomes are recorded in the `pending_writes` table when the batch
+    flushes, so any worker can answer once that has happened. Until then only
+    the worker that accepted the write knows the id; elsewhere it is a 404 for
+    the few milliseconds (WRITE_QUEUE_FLUSH_MS) before the flush.
+    """
+    pending = write_queue.lookup(pending_id)
+    if pending and not pending.future.done():
+        return jsonify({"pendingId": pending_id, "status": "pending"})
+
+    recorded = write_queue.lookup_status(pending_id)
+    if not recorded:
+        return jsonify({"error": "Pending write not found."}), 404
+
+    status, error, workout = recorded
+    result = {"pendingId": pending_id, "status": status}
+    if status == "failed":
+        result["error"] = error
+    elif workout is not None:
+        result["workout"] = workout
+    return jsonify(result)
+
+
 @app.route("/api/workouts/<int:wid>", methods=["PUT"])
 def update_workout(wid):
     body = request.get_json(silent=True)
@@ -401,7 +1062,7 @@ def update_workout(wid):
     def _inner(conn):
         with conn.cursor() as cur:
             cur.execute(
-                """
+                f"""
                 UPDATE workouts
                 SET
                     workout_date = %s,
@@ -413,31 +1074,15 @@ def update_workout(wid):
                     image_url = %s,
                     updated_at = NOW()
                 WHERE id = %s
-                RETURNING
-                    id,
-                    workout_date,
-                    exercise_type,
-                    duration_min,
-                    intensity,
-                    calories_burned,
-                    notes,
-                    image_url;
+                RETURNING {WORKOUT_COLUMNS};
                 """,
-                (
-                    workout["date"],
-                    workout["exerciseType"],
-                    workout["duration"],
-                    workout["intensity"],
-                    workout["caloriesBurned"],
-                    workout["notes"],
-                    workout["imageUrl"],
-                    wid,
-                ),
+                workout_params(workout) + (wid,),
             )
             row = cur.fetchone()
             return row_to_workout(row) if row else None
 
     updated = with_connection(_inner)
+    read_coalescer.bump_epoch()
     if not updated:
         return jsonify({"error": "Workout not found."}), 404
     return jsonify(updated)
@@ -452,6 +1097,7 @@ def delete_workout(wid):
             return deleted
 
     deleted = with_connection(_inner)
+    read_coalescer.bump_epoch()
     if not deleted:
         return jsonify({"error": "Workout not found."}), 404
     return jsonify({"deleted": True, "id": wid})
@@ -460,47 +1106,39 @@ def delete_workout(wid):
 @app.route("/api/stats")
 def stats():
     """
-    Aggregate statistics across all workouts.
+    Aggregate statistics, with per-exercise-type and per-intensity breakdowns.
+
+    Accepts the same filter params as `/api/workouts` (search, exerciseType,
+    intensity, dateFrom, dateTo, and `fresh`); with none given the stats cover
+    every workout.
     Stats view in the UI will also include the *current* page size from the client.
     """
+    filters, err = parse_filter_params()
+    if err:
+        return jsonify(err[0]), err[1]
 
     def _inner(conn):
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                    COUNT(*) AS total_workouts,
-                    COALESCE(SUM(duration_min), 0) AS total_minutes,
-                    COALESCE(SUM(calories_burned), 0) AS total_calories,
-                    COALESCE(AVG(duration_min), 0) AS avg_duration
-                FROM workouts;
-                """
-            )
-            total_workouts, total_minutes, total_calories, avg_duration = cur.fetchone()
+            return fetch_stats(cur, filters)
 
-            cur.execute(
-                """
-                SELECT exercise_type, COUNT(*) AS cnt
-                FROM workouts
-                GROUP BY exercise_type
-                ORDER BY cnt DESC
-                LIMIT 1;
-                """
-            )
-            row = cur.fetchone()
-            most_common_type = row[0] if row else "N/A"
+    data = shared_read("stats", filters, lambda: with_connection(_inner))
+    return respond(data)
 
-            return {
-                "totalWorkouts": total_workouts,
-                "totalMinutes": int(total_minutes or 0),
-                "totalCalories": int(total_calories or 0),
-                "avgDuration": round(avg_duration) if avg_duration else 0,
-                "mostCommonType": most_common_type,
-                "defaultPageSize": PAGE_SIZE_DEFAULT,
-            }
 
-    data = with_connection(_inner)
-    return jsonify(data)
+@app.route("/api/metrics")
+def metrics():
+    """
+    Per-process counters: how often identical reads were coalesced, write
+    queue throughput, and open change-feed subscribers.
+    """
+    return jsonify(
+        {
+            "pid": os.getpid(),
+            "readCoalescing": read_coalescer.stats(),
+            "writeQueue": write_queue.stats(),
+            "changeFeedSubscribers": change_feed.subscriber_count(),
+        }
+    )
 
 
 @app.route("/api/seed", methods=["POST"])
@@ -513,9 +1151,329 @@ def seed_endpoint():
     table has fewer than 30 rows.
     """
     seed_db_if_needed()
+    read_coalescer.bump_epoch()
     return jsonify({"seeded": True}), 200
 
 
+# ---------------------------------------------------------------------------
+# Background jobs
+#
+# Work too big for one request (bulk imports, full exports, stats over long
+# date ranges) is queued in Postgres and run by `flask --app app jobs-worker`.
+# See jobs.py for the queue itself.
+# ---------------------------------------------------------------------------
+
+
+@job_handler("import_workouts")
+def import_workouts_job(ctx, payload):
+    """
+    Insert `payload["workouts"]` (same shape as POST /api/workouts bodies).
+    Invalid rows are skipped and reported. Valid ones go in JOB_BATCH_ROWS at
+    a time, each batch in its own transaction together with a checkpoint, so
+    a retry resumes after the last committed batch instead of importing rows
+    twice. Cancelling keeps the batches already committed.
+    """
+    items = payload.get("workouts")
+    if not isinstance(items, list):
+        raise JobFailed("payload.workouts must be a list.")
+
+    rows = []
+    errors = []
+    for i, item in enumerate(items):
+        workout, err = validate_workout(item)
+        if err:
+            errors.append({"index": i, "error": err[0]["error"]})
+        else:
+            rows.append(workout_params(workout))
+
+    def _insert_batch(start):
+        def _inner(conn):
+            batch = rows[start : start + JOB_BATCH_ROWS]
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO workouts ({INSERT_COLUMNS}) VALUES %s;",
+                    batch,
+                    page_size=JOB_BATCH_ROWS,
+                )
+            done = start + len(batch)
+            ctx.save_checkpoint(conn, {"rowsDone": done}, done / len(rows))
+
+        with_connection(_inner)
+
+    resume_at = (ctx.checkpoint or {}).get("rowsDone", 0)
+    for start in range(resume_at, len(rows), JOB_BATCH_ROWS):
+        _insert_batch(start)
+    return {"imported": len(rows), "skipped": len(errors), "errors": errors[:100]}
+
+
+@job_handler("export_workouts")
+def export_workouts_job(ctx, payload):
+    """
+    Export every workout matching `payload["filters"]`, newest first.
+    `payload["format"]` may be "columnar" for one array per field.
+
+    Rows are read through a server-side cursor and written out JOB_BATCH_ROWS
+    at a time to `job_export_chunks`, so memory stays flat however big the
+    export is. The result only carries counts; the data is downloaded chunk
+    by chunk from GET /api/jobs/<id>/export.
+    """
+    filters, err = parse_filter_params(payload.get("filters") or {})
+    if err:
+        raise JobFailed(err[0]["error"])
+    fmt = payload.get("format", "rows")
+    if fmt not in RESPONSE_FORMATS:
+        raise JobFailed("format must be 'rows' or 'columnar'.")
+    where_sql, params = build_where(filters)
+
+    def _clear_chunks(conn):
+        # Left over from an earlier attempt, which read a different snapshot.
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM job_export_chunks WHERE job_id = %s;", (ctx.job_id,))
+        ctx.save_checkpoint(conn, {"chunks": 0}, 0.0)
+
+    def _store_chunk(conn, chunk_no, batch, exported, total):
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO job_export_chunks (job_id, chunk_no, data) VALUES (%s, %s, %s);",
+                (ctx.job_id, chunk_no, Json(encode_workouts(batch, fmt))),
+            )
+        ctx.save_checkpoint(conn, {"chunks": chunk_no + 1}, exported / total)
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+            cur.execute(f"SELECT COUNT(*) FROM workouts {where_sql};", params)
+            total = cur.fetchone()[0]
+
+        exported = 0
+        chunks = 0
+        # Server-side cursor: rows arrive in batches instead of all at once.
+        # Chunks are written on a second connection, since this transaction
+        # is read-only and has to stay open for the cursor.
+        with conn.cursor(name="export_workouts") as cur:
+            cur.execute(
+                f"""
+                SELECT {WORKOUT_COLUMNS}
+                FROM workouts
+                {where_sql}
+                ORDER BY workout_date DESC, id DESC;
+                """,
+                params,
+            )
+            while True:
+                batch = cur.fetchmany(JOB_BATCH_ROWS)
+                if not batch:
+                    break
+                exported += len(batch)
+                with_connection(
+                    lambda wconn: _store_chunk(wconn, chunks, batch, exported, total)
+                )
+                chunks += 1
+        return exported, chunks
+
+    with_connection(_clear_chunks)
+    count, chunks = with_connection(_inner)
+    return {"count": count, "format": fmt, "chunks": chunks}
+
+
+@job_handler("stats_report", stale_after=JOB_STATS_REPORT_STALE_SECONDS)
+def stats_report_job(ctx, payload):
+    """Compute /api/stats for `payload["filters"]` (e.g. a multi-year date range)."""
+    filters, err = parse_filter_params(payload.get("filters") or {})
+    if err:
+        raise JobFailed(err[0]["error"])
+    # Last chance to notice a cancel (or a lost claim) before the long query.
+    ctx.progress(0.0)
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s;", (JOB_STATS_REPORT_TIMEOUT_MS,))
+            return fetch_stats(cur, filters)
+
+    return with_connection(_inner)
+
+
+@app.route("/api/jobs", methods=["POST"])
+def create_job():
+    """
+    Queue a background job.
+
+    Body: {"kind": "import_workouts" | "export_workouts" | "stats_report",
+           "payload": {...}, "maxAttempts": 3}
+    Responds 202 with the job; poll GET /api/jobs/<id> for status and progress.
+    A finished export's data is fetched from GET /api/jobs/<id>/export.
+    """
+    body = request.get_json(silent=True) or {}
+    kind = body.get("kind")
+    if kind not in job_kinds():
+        return jsonify({"error": f"Unknown job kind. Expected one of: {', '.join(job_kinds())}."}), 400
+
+    payload = body.get("payload", {})
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Payload must be an object."}), 400
+
+    try:
+        max_attempts = int(body.get("maxAttempts", 3))
+    except (TypeError, ValueError):
+        return jsonify({"error": "maxAttempts must be an integer."}), 400
+    if max_attempts < 1 or max_attempts > JOB_MAX_ATTEMPTS_LIMIT:
+        return jsonify({"error": f"maxAttempts must be between 1 and {JOB_MAX_ATTEMPTS_LIMIT}."}), 400
+
+    return jsonify(enqueue_job(kind, payload, max_attempts)), 202
+
+
+@app.route("/api/jobs/<int:jid>", methods=["GET"])
+def get_job_status(jid):
+    job = get_job(jid)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job)
+
+
+@app.route("/api/jobs/<int:jid>/export")
+def get_job_export(jid):
+    """
+    Download a finished export_workouts job, one chunk per request.
+
+    Query params:
+      - chunk: 0-based chunk number (default 0); the job's `result.chunks`
+        says how many there are, each up to JOB_BATCH_ROWS workouts
+
+    `workouts` in each chunk is in the format the export was requested in.
+    Send `Accept: application/msgpack` for a MessagePack body instead of JSON.
+    Export data is kept for jobs.OUTPUT_RETENTION_HOURS after the job
+    finishes; after that this answers 410 and the export has to be re-run.
+    """
+    job = get_job(jid)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    if job["kind"] != "export_workouts" or job["status"] != "succeeded":
+        return jsonify({"error": "Job has no finished export to download."}), 409
+    if job["result"].get("expired"):
+        return jsonify({"error": "Export data has expired; run the export again."}), 410
+
+    chunks = job["result"]["chunks"]
+    chunk = request.args.get("chunk", 0, type=int)
+    if chunk is None or chunk < 0 or chunk >= max(chunks, 1):
+        return jsonify({"error": f"chunk must be between 0 and {max(chunks - 1, 0)}."}), 400
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT data FROM job_export_chunks WHERE job_id = %s AND chunk_no = %s;",
+                (jid, chunk),
+            )
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    data = with_connection(_inner)
+    if data is None:
+        if chunks:
+            # Pruned between the status check and the read.
+            return jsonify({"error": "Export data has expired; run the export again."}), 410
+        # An export with no matching workouts has no chunks at all.
+        data = encode_workouts([], job["result"]["format"])
+    return respond(
+        {
+            "jobId": jid,
+            "chunk": chunk,
+            "chunks": chunks,
+            "format": job["result"]["format"],
+            "workouts": data,
+        }
+    )
+
+
+@app.route("/api/jobs/<int:jid>/cancel", methods=["POST"])
+def cancel_job_endpoint(jid):
+    """
+    Cancel a job. Queued jobs stop immediately; running jobs are flagged and
+    stop at their next progress update (status stays "running" until then).
+    """
+    job = cancel_job(jid)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    if job["status"] in FINISHED_STATUSES and job["status"] != "cancelled":
+        return jsonify({"error": "Job has already finished."}), 409
+    return jsonify(job)
+
+
+@app.cli.command("jobs-worker")
+@click.option("--concurrency", default=2, show_default=True, help="Number of worker processes.")
+def jobs_worker_command(concurrency):
+    """Run background job workers until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+    # Import-time setup runs on unpooled connections, so this normally finds
+    # nothing; it just guarantees forked workers never inherit a pool.
+    close_pool()
+    run_workers(concurrency)
+
+
+# ---------------------------------------------------------------------------
+# Warm-up
+#
+# Run once per worker process (from the gunicorn post_fork hook, see
+# gunicorn.conf.py, or lazily by the first /api/ready probe). It opens the pool
+# and runs the common list/stats query shapes on every pooled connection, so
+# each backend has its catalog caches loaded and the hot pages are in shared
+# buffers before real traffic arrives.
+# ---------------------------------------------------------------------------
+
+warm_up_done = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_pid = None
+
+
+def _prime_connection(conn):
+    default_query = {
+        "page": 1,
+        "pageSize": PAGE_SIZE_DEFAULT,
+        "search": "",
+        "exerciseType": "",
+        "intensity": "",
+        "dateFrom": None,
+        "dateTo": None,
+        "sortColumn": SORT_COLUMNS["date"],
+        "sortDir": "DESC",
+        "fields": WORKOUT_FIELDS,
+    }
+    with conn.cursor() as cur:
+        fetch_workout_page(cur, default_query)
+        fetch_stats(cur, default_query)
+
+
+def warm_up():
+    """Warm this process's pool, retrying until the database is reachable."""
+    while True:
+        try:
+            started = time.monotonic()
+            count = warm_pool(_prime_connection)
+            logger.info(
+                "Warm-up finished: %d connections in %.2fs", count, time.monotonic() - started
+            )
+            warm_up_done.set()
+            return
+        except Exception:
+            logger.exception("Warm-up failed; retrying.")
+            time.sleep(WARM_UP_RETRY_SECONDS)
+
+
+def start_warm_up():
+    """
+    Start warm-up in the background, once per process, along with the change
+    feed listener that keeps the read epoch in step with other processes.
+    """
+    global _warm_up_pid
+    with _warm_up_lock:
+        if _warm_up_pid == os.getpid():
+            return
+        _warm_up_pid = os.getpid()
+        warm_up_done.clear()
+    change_feed.start()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
 # Serve frontend from / when running as single app (e.g. Render)
 @app.route("/")
 def index():
@@ -525,5 +1483,6 @@ def index():
 if __name__ == "__main__":
     # Default 5001 locally (macOS often uses 5000 for AirPlay); Render/etc. set PORT
     port = int(os.environ.get("PORT", 5001))
+    start_warm_up()
     app.run(host="0.0.0.0", port=port, debug=(os.environ.get("FLASK_ENV") == "development"))
 
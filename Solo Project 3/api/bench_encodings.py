@@ -0,0 +1,90 @@
+"""
+Benchmark: response size and encode time for the workout list encodings.
+
+Compares the current JSON (one object per row, built with `row_to_workout`)
+against columnar JSON and MessagePack, for a normal page and an export-sized
+batch. Uses synthetic rows shaped like real `workouts` rows, so no database
+is needed.
+
+Usage:
+    python bench_encodings.py --rows 50 10000 --repeat 200
+"""
+
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+from serializers import encode_workouts, to_msgpack
+
+
+TYPES = ["Cardio", "Strength Training", "Yoga", "HIIT", "Sports", "Flexibility"]
+INTENSITIES = ["Low", "Medium", "High"]
+NOTES = ["Morning workout, felt great!", "Tough session but pushed through.", "", None]
+IMAGE_URL = "https://images.pexels.com/photos/1552106/pexels-photo-1552106.jpeg"
+
+
+def make_rows(count):
+    today = date(2024, 6, 1)
+    return [
+        (
+            i + 1,
+            today - timedelta(days=i),
+            TYPES[i % len(TYPES)],
+            20 + (i * 2) % 50,
+            INTENSITIES[i % len(INTENSITIES)],
+            min(2000, (20 + (i * 2) % 50) * (6 + i % 5)),
+            NOTES[i % len(NOTES)],
+            IMAGE_URL,
+        )
+        for i in range(count)
+    ]
+
+
+def to_json(payload):
+    # Compact separators, as Flask's jsonify uses outside debug mode.
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+ENCODINGS = {
+    "json rows (current)": lambda rows: to_json({"workouts": encode_workouts(rows, "rows")}),
+    "json columnar": lambda rows: to_json({"workouts": encode_workouts(rows, "columnar")}),
+    "msgpack rows": lambda rows: to_msgpack({"workouts": encode_workouts(rows, "rows")}),
+    "msgpack columnar": lambda rows: to_msgpack({"workouts": encode_workouts(rows, "columnar")}),
+}
+
+
+def bench(rows, repeat):
+    results = {}
+    for name, encode in ENCODINGS.items():
+        body = encode(rows)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            encode(rows)
+        elapsed = (time.perf_counter() - start) / repeat
+        results[name] = (len(body), elapsed)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 10000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for count in args.rows:
+        rows = make_rows(count)
+        repeat = max(3, args.repeat * 50 // max(count, 50))
+        results = bench(rows, repeat)
+        base_size, base_time = results["json rows (current)"]
+        print(f"\n{count} rows ({repeat} runs each)")
+        print(f"  {'encoding':<22}{'bytes':>10}{'size':>8}{'encode':>12}{'time':>8}")
+        for name, (size, elapsed) in results.items():
+            print(
+                f"  {name:<22}{size:>10,}{size / base_size:>8.0%}"
+                f"{elapsed * 1e6:>10,.0f}us{elapsed / base_time:>8.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: one-transaction-per-insert vs. the group-commit write queue.
+
+Runs against the database in DATABASE_URL, but writes to a scratch table
+(`workouts_bench`, created LIKE `workouts` and dropped afterwards) so real data
+is untouched. The scratch table gets copies of the `workouts` triggers, so
+each insert pays for the change stamp and NOTIFY like a real one; the NOTIFY
+goes to a bench channel so live stream clients don't see the rows. Each mode
+uses the same number of concurrent writer threads, mirroring concurrent
+POST /api/workouts requests.
+
+Usage:
+    python bench_write_queue.py --threads 16 --rows 2000
+"""
+
+import argparse
+import re
+import threading
+import time
+from datetime import date
+
+from db import with_connection
+from serializers import INSERT_COLUMNS, workout_params
+from write_queue import WriteQueue
+
+
+BENCH_TABLE = "workouts_bench"
+BENCH_STATUS_TABLE = "pending_writes_bench"
+BENCH_NOTIFY_FUNCTION = "notify_workout_change_bench"
+
+SAMPLE_WORKOUT = {
+    "date": date(2024, 1, 1),
+    "exerciseType": "Cardio",
+    "duration": 30,
+    "intensity": "Medium",
+    "caloriesBurned": 250,
+    "notes": "Benchmark row",
+    "imageUrl": "https://images.pexels.com/photos/1552106/pexels-photo-1552106.jpeg",
+}
+
+
+def create_bench_table():
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}, {BENCH_STATUS_TABLE};")
+            cur.execute(f"CREATE TABLE {BENCH_TABLE} (LIKE workouts INCLUDING ALL);")
+            cur.execute(
+                f"CREATE TABLE {BENCH_STATUS_TABLE} (LIKE pending_writes INCLUDING ALL);"
+            )
+
+            # LIKE doesn't copy triggers. Clone the notify function onto its
+            # own channel, then recreate each trigger on the scratch table.
+            cur.execute("SELECT pg_get_functiondef('notify_workout_change'::regproc);")
+            cur.execute(
+                cur.fetchone()[0]
+                .replace("notify_workout_change(", f"{BENCH_NOTIFY_FUNCTION}(")
+                .replace("'workout_changes'", "'workout_changes_bench'")
+            )
+            cur.execute(
+                "SELECT pg_get_triggerdef(oid) FROM pg_trigger "
+                "WHERE tgrelid = 'workouts'::regclass AND NOT tgisinternal;"
+            )
+            for (definition,) in cur.fetchall():
+                definition = re.sub(r" ON \S+ FOR ", f" ON {BENCH_TABLE} FOR ", definition, count=1)
+                cur.execute(
+                    definition.replace("notify_workout_change()", f"{BENCH_NOTIFY_FUNCTION}()")
+                )
+
+    with_connection(_inner)
+
+
+def drop_bench_table():
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}, {BENCH_STATUS_TABLE};")
+            cur.execute(f"DROP FUNCTION IF EXISTS {BENCH_NOTIFY_FUNCTION}();")
+
+    with_connection(_inner)
+
+
+def insert_direct():
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {BENCH_TABLE} ({INSERT_COLUMNS}) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s);",
+                workout_params(SAMPLE_WORKOUT),
+            )
+
+    with_connection(_inner)
+
+
+def run_threads(threads, rows, insert_one):
+    """
+    Split `rows` inserts across `threads` writers. Returns (elapsed seconds,
+    rows inserted); the count is rounded down to a multiple of `threads`.
+    """
+    per_thread = rows // threads
+
+    def writer():
+        for _ in range(per_thread):
+            insert_one()
+
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start, per_thread * threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--flush-ms", type=int, default=2)
+    parser.add_argument("--max-rows", type=int, default=200)
+    args = parser.parse_args()
+
+    create_bench_table()
+    try:
+        elapsed, count = run_threads(args.threads, args.rows, insert_direct)
+        direct_rate = count / elapsed
+        print(f"direct:  {count} rows in {elapsed:.2f}s  ({direct_rate:,.0f} rows/s)")
+
+        wq = WriteQueue(
+            lambda row: row[0],
+            table=BENCH_TABLE,
+            status_table=BENCH_STATUS_TABLE,
+            flush_ms=args.flush_ms,
+            max_rows=args.max_rows,
+        )
+
+        def insert_queued():
+            wq.submit(SAMPLE_WORKOUT).future.result()
+
+        elapsed, count = run_threads(args.threads, args.rows, insert_queued)
+        queued_rate = count / elapsed
+        stats = wq.stats()
+        avg_batch = stats["rowsFlushed"] / max(stats["batchesFlushed"], 1)
+        print(
+            f"queued:  {count} rows in {elapsed:.2f}s  ({queued_rate:,.0f} rows/s, "
+            f"{stats['batchesFlushed']} batches, avg {avg_batch:.1f} rows/batch)"
+        )
+        print(f"speedup: {queued_rate / direct_rate:.1f}x")
+    finally:
+        drop_bench_table()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Change feed for Solo Project 3 — Workout Log Manager.
+
+This module is responsible for:
+- Holding one shared LISTEN connection per process on the `workout_changes`
+  channel (see the trigger created in `db.init_db`)
+- Fanning each notification out to every connected subscriber
+- Keeping a short backlog of recent events so a reconnecting client can
+  resume from its last event id
+- Telling the rest of the process that data changed (`on_change`), whichever
+  process made the change
+
+The listener thread is started by `start()` (the API calls it from each
+worker's warm-up) or lazily on the first subscription, so it is created in the
+worker process after any gunicorn fork rather than in the master.
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from db import get_connection
+
+
+logger = logging.getLogger(__name__)
+
+# How long the listener waits on the socket before checking it is still alive.
+LISTEN_POLL_SECONDS = 5
+# Pause before reconnecting after the listener connection drops.
+RECONNECT_DELAY_SECONDS = 2
+
+
+class Subscription:
+    """
+    One connected client. Events are delivered on `events`; `reset` is set
+    when the client has missed events and must reload its state.
+    """
+
+    def __init__(self, max_pending: int):
+        self.events: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_pending)
+        self.replay: list = []
+        self.reset = False
+
+    def mark_reset(self) -> None:
+        """
+        Flag a reset and wake the reader right away. Queued events are
+        dropped (the reload supersedes them) and replaced by a `None` wake-up,
+        so the reader doesn't sit out its heartbeat timeout first.
+        """
+        self.reset = True
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self.events.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class TooManySubscribers(Exception):
+    """Raised by `ChangeFeed.subscribe` when the per-process cap is reached."""
+
+
+class ChangeFeed:
+    """
+    A single LISTEN connection shared by every subscriber in the process.
+
+    Events are (event_id, data) tuples where event_id is the `seq` assigned by
+    the trigger. Postgres delivers notifications in commit order, which is not
+    necessarily `seq` order, so resuming looks the id up by position in the
+    backlog rather than comparing numbers.
+
+    `on_change`, if given, is called for every notification and after the
+    listener reconnects (when notifications may have been missed), even with
+    no subscribers connected.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        max_subscribers: int,
+        backlog_size: int = 500,
+        max_pending: int = 256,
+        on_change: Optional[Callable[[], None]] = None,
+    ):
+        self.channel = channel
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.on_change = on_change
+        self._backlog: deque = deque(maxlen=backlog_size)
+        self._subscribers: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def start(self) -> None:
+        """Start the listener thread for this process if it is not running."""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="changefeed-listener", daemon=True
+            )
+            self._thread.start()
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Register a new subscriber. If `last_event_id` is given, events after it
+        are queued for replay; if it is no longer in the backlog, the
+        subscription starts with `reset` set instead.
+
+        Each subscriber ties up a request thread for as long as it stays
+        connected, so at most `max_subscribers` are allowed per process;
+        beyond that this raises TooManySubscribers.
+        """
+        self.start()
+        sub = Subscription(self.max_pending)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            if last_event_id:
+                ids = [str(event_id) for event_id, _ in self._backlog]
+                if last_event_id in ids:
+                    sub.replay = list(self._backlog)[ids.index(last_event_id) + 1 :]
+                else:
+                    sub.reset = True
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _publish(self, event_id, data) -> None:
+        with self._lock:
+            self._backlog.append((event_id, data))
+            for sub in self._subscribers:
+                try:
+                    sub.events.put_nowait((event_id, data))
+                except queue.Full:
+                    # Slow client: drop it back to a full reload rather than
+                    # letting its queue grow without bound.
+                    sub.mark_reset()
+
+    def _reset_all(self) -> None:
+        """Tell every subscriber it may have missed events (listener gap)."""
+        with self._lock:
+            self._backlog.clear()
+            for sub in self._subscribers:
+                sub.mark_reset()
+
+    def _notify_change(self) -> None:
+        if self.on_change is None:
+            return
+        try:
+            self.on_change()
+        except Exception:
+            logger.exception("Change feed on_change callback failed.")
+
+    def _run(self) -> None:
+        first_connect = True
+        while True:
+            conn = None
+            try:
+                conn = get_connection()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel};")
+                if not first_connect:
+                    self._notify_change()
+                    self._reset_all()
+                first_connect = False
+
+                while True:
+                    ready, _, _ = select.select([conn], [], [], LISTEN_POLL_SECONDS)
+                    if not ready:
+                        # Cheap round trip so a dead connection is noticed.
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1;")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            data = json.loads(notify.payload)
+                        except ValueError:
+                            continue
+                        self._notify_change()
+                        self._publish(data.get("seq"), data)
+            except Exception:
+                logger.exception("Change feed listener lost its connection; reconnecting.")
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(RECONNECT_DELAY_SECONDS)
@@ -3,28 +3,49 @@ Database helpers for Solo Project 3 — Workout Log Manager.
 
 This module is responsible for:
 - Reading the DATABASE_URL environment variable
-- Opening PostgreSQL connections
+- Opening PostgreSQL connections and keeping a small per-process pool of them
 - Ensuring the `workouts` table exists with the expected schema
 
-You will import `init_db` once at startup and call `get_connection`
+You will import `init_db` once at startup and use `with_connection`
 whenever you need to run a query.
 """
 
 import os
-from typing import Callable, Any
+import threading
+from typing import Callable, Any, Optional
 
 import psycopg2
 from psycopg2.extensions import connection as PGConnection
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Request threads per gunicorn worker (see gunicorn.conf.py). Each one may
+# hold a connection, so by default the pool keeps that many open, plus a few
+# more for the write-queue flusher and other background threads.
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", 16))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", WORKER_THREADS))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", WORKER_THREADS + 4))
+# How long a caller waits for a free connection before giving up.
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 10))
+
+# Bump whenever the SQL in `init_db` changes, so existing databases pick it up.
+SCHEMA_VERSION = 2
+# Advisory lock key that serializes `init_db` across processes.
+SCHEMA_LOCK_ID = 37500001
+
+_pool: Optional["BlockingConnectionPool"] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
 
 def get_connection() -> PGConnection:
     """
-    Open a new PostgreSQL connection using DATABASE_URL.
+    Open a new, unpooled PostgreSQL connection using DATABASE_URL.
 
-    For this project, opening/closing a connection per request is fine.
+    Request handlers should use `with_connection`, which draws from the pool;
+    this is for long-lived connections such as the change feed listener.
     Render's external/internal URLs already include SSL options where needed,
     so we just pass the URL straight through.
     """
@@ -33,12 +54,114 @@ def get_connection() -> PGConnection:
     return psycopg2.connect(DATABASE_URL)
 
 
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool raises PoolError as soon as every connection is
+    checked out. This one makes callers wait (up to `timeout` seconds) for a
+    connection to come back instead, so a burst of requests queues rather
+    than failing.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *args, timeout: float, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(
+                f"No database connection free after {self.timeout:g}s (pool max {self.maxconn})."
+            )
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool() -> BlockingConnectionPool:
+    """
+    Return this process's connection pool, creating it on first use.
+
+    The pool is keyed on the process id: a gunicorn worker forked from a master
+    that already had a pool gets a fresh one instead of sharing sockets.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if not DATABASE_URL:
+                raise RuntimeError("DATABASE_URL is not set. Check your env vars or .env file.")
+            _pool = BlockingConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL, timeout=DB_POOL_TIMEOUT_SECONDS
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def close_pool() -> None:
+    """Close every pooled connection in this process (e.g. before forking workers)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
+
+
+def configure_pool(minconn: int, maxconn: int) -> None:
+    """
+    Resize this process's pool (takes effect the next time it is opened).
+    For processes that aren't gunicorn workers, such as the job workers,
+    which only need a couple of connections each.
+    """
+    global DB_POOL_MIN, DB_POOL_MAX
+    close_pool()
+    DB_POOL_MIN, DB_POOL_MAX = minconn, maxconn
+
+
+def warm_pool(fn: Callable[[PGConnection], Any]) -> int:
+    """
+    Check out DB_POOL_MIN connections at once (by default one per request
+    thread), run `fn` on each, and return them. Used at startup so the first
+    requests don't pay for connection setup or cold per-connection caches.
+    Returns how many connections were warmed.
+    """
+    pool = get_pool()
+    conns = []
+    try:
+        for _ in range(DB_POOL_MIN):
+            conns.append(pool.getconn())
+        for conn in conns:
+            fn(conn)
+            conn.rollback()
+    finally:
+        for conn in conns:
+            pool.putconn(conn, close=bool(conn.closed))
+    return len(conns)
+
+
 def init_db() -> None:
     """
-    Create the `workouts` table if it does not already exist.
+    Create the `workouts` table if it does not already exist, along with the
+    triggers that stamp changes for delta sync, record tombstones for deletes,
+    and publish row changes over LISTEN/NOTIFY.
 
-    This is idempotent and safe to call on startup. It only creates the table;
+    This is idempotent and safe to call on startup. It only creates the schema;
     seeding initial data will be handled separately.
+
+    Every process runs this at startup: the gunicorn master and each
+    jobs-worker. The DDL takes heavy locks (ALTER TABLE takes ACCESS
+    EXCLUSIVE on `workouts` even when the column already exists), and
+    concurrent CREATE OR REPLACE FUNCTION calls can fail with "tuple
+    concurrently updated". So the DDL only runs when the recorded
+    `schema_version` is older than SCHEMA_VERSION, and an advisory lock
+    makes concurrent boots take turns.
     """
     create_table_sql = """
     CREATE TABLE IF NOT EXISTS workouts (
@@ -54,22 +177,206 @@ def init_db() -> None:
         updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
     );
 
-    CREATE INDEX IF NOT EXISTS idx_workouts_date ON workouts (workout_date DESC);
-    CREATE INDEX IF NOT EXISTS idx_workouts_exercise_type ON workouts (exercise_type);
+    -- Date-ordered pages: covers every field except notes/image_url, so narrow
+    -- `fields=` projections can be served by an index-only scan. Replaces
+    -- the plain date index it supersedes.
+    CREATE INDEX IF NOT EXISTS idx_workouts_date_covering
+        ON workouts (workout_date DESC)
+        INCLUDE (id, exercise_type, duration_min, intensity, calories_burned);
+    DROP INDEX IF EXISTS idx_workouts_date;
+
+    -- Filtered stats: equality on type and/or intensity plus a date range, with
+    -- the aggregated columns included so the scan can be index-only. The
+    -- type-leading index also serves plain exerciseType filters, so the old
+    -- single-column index on it is dropped.
+    CREATE INDEX IF NOT EXISTS idx_workouts_type_intensity_date
+        ON workouts (exercise_type, intensity, workout_date)
+        INCLUDE (duration_min, calories_burned);
+    CREATE INDEX IF NOT EXISTS idx_workouts_intensity_date
+        ON workouts (intensity, workout_date)
+        INCLUDE (exercise_type, duration_min, calories_burned);
+    DROP INDEX IF EXISTS idx_workouts_exercise_type;
+
+    -- Delta sync (/api/workouts/changes): every write stamps the row with its
+    -- transaction id, and deletes leave a tombstone stamped the same way.
+    -- Transaction ids (unlike updated_at or a sequence) let the API tell which
+    -- writes may still be uncommitted, so a client's token never skips one.
+    ALTER TABLE workouts ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS idx_workouts_change_xid ON workouts (change_xid, id);
+
+    CREATE TABLE IF NOT EXISTS workout_tombstones (
+        workout_id INTEGER PRIMARY KEY,
+        change_xid BIGINT NOT NULL,
+        deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_workout_tombstones_change_xid
+        ON workout_tombstones (change_xid, workout_id);
+
+    CREATE OR REPLACE FUNCTION stamp_workout_change() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_xid := txid_current();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION record_workout_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO workout_tombstones (workout_id, change_xid)
+        VALUES (OLD.id, txid_current())
+        ON CONFLICT (workout_id) DO UPDATE
+            SET change_xid = EXCLUDED.change_xid, deleted_at = NOW();
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS workouts_stamp_change ON workouts;
+    CREATE TRIGGER workouts_stamp_change
+        BEFORE INSERT OR UPDATE ON workouts
+        FOR EACH ROW EXECUTE FUNCTION stamp_workout_change();
+
+    DROP TRIGGER IF EXISTS workouts_record_tombstone ON workouts;
+    CREATE TRIGGER workouts_record_tombstone
+        AFTER DELETE ON workouts
+        FOR EACH ROW EXECUTE FUNCTION record_workout_tombstone();
+
+    -- Background jobs (see jobs.py). Workers claim queued rows with
+    -- FOR UPDATE SKIP LOCKED; the partial indexes keep both the claim query
+    -- and the stale-job sweep from scanning finished jobs.
+    CREATE TABLE IF NOT EXISTS jobs (
+        id SERIAL PRIMARY KEY,
+        kind VARCHAR(50) NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}',
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+        result JSONB,
+        error TEXT,
+        run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        locked_at TIMESTAMPTZ,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    -- Handler-defined resume point, saved in the same transaction as the work
+    -- it describes so a retried job can pick up where the last attempt stopped.
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS checkpoint JSONB;
+    -- Per-kind stale window (see `job_handler` in jobs.py), copied in at enqueue.
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS stale_after_seconds INTEGER NOT NULL DEFAULT 300;
+    CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_after, id) WHERE status = 'queued';
+    CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_at) WHERE status = 'running';
+
+    -- Output of export jobs, one row per batch, so neither the worker nor any
+    -- single response has to hold a whole export (GET /api/jobs/<id>/export).
+    CREATE TABLE IF NOT EXISTS job_export_chunks (
+        job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+        chunk_no INTEGER NOT NULL,
+        data JSONB NOT NULL,
+        PRIMARY KEY (job_id, chunk_no)
+    );
+
+    -- Outcome of each write-queue insert (see write_queue.py), written in the
+    -- same transaction as the batch so any worker can answer
+    -- GET /api/workouts/pending/<id>. Old rows are pruned by the flusher.
+    CREATE TABLE IF NOT EXISTS pending_writes (
+        pending_id VARCHAR(32) PRIMARY KEY,
+        status VARCHAR(20) NOT NULL,
+        workout_id INTEGER,
+        error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_pending_writes_created_at ON pending_writes (created_at);
+
+    -- Change feed: every insert/update/delete sends a compact delta on the
+    -- `workout_changes` channel. `seq` doubles as the SSE event id.
+    CREATE SEQUENCE IF NOT EXISTS workout_change_seq;
+
+    CREATE OR REPLACE FUNCTION notify_workout_change() RETURNS trigger AS $$
+    DECLARE
+        payload JSON;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            -- The deleted row lets clients adjust totals without refetching.
+            payload := json_build_object(
+                'seq', nextval('workout_change_seq'),
+                'op', 'delete',
+                'id', OLD.id,
+                'row', json_build_object(
+                    'id', OLD.id,
+                    'date', OLD.workout_date,
+                    'exerciseType', OLD.exercise_type,
+                    'duration', OLD.duration_min,
+                    'intensity', OLD.intensity,
+                    'caloriesBurned', OLD.calories_burned,
+                    'notes', COALESCE(OLD.notes, ''),
+                    'imageUrl', OLD.image_url
+                )
+            );
+        ELSE
+            payload := json_build_object(
+                'seq', nextval('workout_change_seq'),
+                'op', lower(TG_OP),
+                'id', NEW.id,
+                'row', json_build_object(
+                    'id', NEW.id,
+                    'date', NEW.workout_date,
+                    'exerciseType', NEW.exercise_type,
+                    'duration', NEW.duration_min,
+                    'intensity', NEW.intensity,
+                    'caloriesBurned', NEW.calories_burned,
+                    'notes', COALESCE(NEW.notes, ''),
+                    'imageUrl', NEW.image_url
+                )
+            );
+        END IF;
+        PERFORM pg_notify('workout_changes', payload::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS workouts_notify_change ON workouts;
+    CREATE TRIGGER workouts_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON workouts
+        FOR EACH ROW EXECUTE FUNCTION notify_workout_change();
     """
 
     conn = get_connection()
     try:
         with conn:
             with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_ID,))
+                cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL);")
+                cur.execute("SELECT MAX(version) FROM schema_version;")
+                current = cur.fetchone()[0]
+                # A newer schema is left alone too: during a rolling deploy the
+                # old release may boot after the new one has migrated.
+                if current is not None and current >= SCHEMA_VERSION:
+                    return
                 cur.execute(create_table_sql)
+                cur.execute("DELETE FROM schema_version;")
+                cur.execute("INSERT INTO schema_version (version) VALUES (%s);", (SCHEMA_VERSION,))
+    finally:
+        conn.close()
+
+
+def with_direct_connection(fn: Callable[[PGConnection], Any]) -> Any:
+    """
+    Like `with_connection`, but on a fresh unpooled connection that is closed
+    afterwards. For one-off startup work in processes that never serve
+    requests themselves (the preloaded gunicorn master, the jobs-worker
+    supervisor), so they don't open a whole pool just to close it again.
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            return fn(conn)
     finally:
         conn.close()
 
 
 def with_connection(fn: Callable[[PGConnection], Any]) -> Any:
     """
-    Small helper to run a function with a managed connection.
+    Small helper to run a function with a pooled connection.
 
     Example usage in route handlers:
 
@@ -83,18 +390,22 @@ def with_connection(fn: Callable[[PGConnection], Any]) -> Any:
             return with_connection(_inner)
     """
 
-    conn = get_connection()
+    pool = get_pool()
+    conn = pool.getconn()
     try:
         result = fn(conn)
         # Explicitly commit any changes made inside fn.
         # This ensures INSERT/UPDATE/DELETE statements are persisted,
         # including initial seeding.
+        conn.commit()
+        return result
+    except Exception:
+        # Leave nothing half-done on a connection that goes back to the pool.
         try:
-            conn.commit()
+            conn.rollback()
         except Exception:
-            # In case of read-only operations, commit is a no-op.
+            # Broken connection; putconn below discards it.
             pass
-        return result
+        raise
     finally:
-        conn.close()
-
+        pool.putconn(conn, close=bool(conn.closed))
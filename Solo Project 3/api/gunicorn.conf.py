@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for the Workout Log Manager API.
+
+Start with:  gunicorn -c gunicorn.conf.py app:app
+
+preload_app imports app.py once in the master, so schema setup and seeding
+run once instead of per worker and workers fork with the code already loaded.
+Each worker then warms its own connection pool in post_fork; /api/ready
+reports 503 until that finishes. On a graceful stop, worker_exit flushes any
+writes still waiting in the group-commit queue before the worker exits.
+"""
+
+import os
+
+# Gunicorn binds to $PORT on its own when it is set (Render does this).
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+# Threaded workers: SSE streams (/api/workouts/stream) hold a thread, not a
+# whole process, and don't trip the sync worker timeout. They still hold that
+# thread for as long as the tab is open, so app.py caps streams per worker at
+# STREAM_MAX_PER_WORKER (a quarter of the threads by default) and turns extra
+# subscribers away with 503. Deployments with more open tabs than that serve
+# streams from the gevent service in gunicorn_stream.conf.py instead.
+worker_class = "gthread"
+# db.py reads the same variable to size each worker's connection pool.
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    # Imported here so the hook uses the module preload_app already loaded.
+    from app import start_warm_up
+
+    start_warm_up()
+
+
+def worker_exit(server, worker):
+    # Runs once the worker has stopped serving requests; the timeout keeps a
+    # stuck flush from holding up the restart.
+    from app import write_queue
+
+    write_queue.stop(timeout=10)
@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for the change stream service (/api/workouts/stream).
+
+Start with:  gunicorn -c gunicorn_stream.conf.py app:app
+
+The main service runs threaded workers, where every open stream holds a
+request thread for as long as the tab stays open. This service runs the same
+app on gevent workers instead: a stream is a greenlet parked on its event
+queue, so one worker can hold thousands of them. Point the frontend's
+STREAM_BASE_URL here and keep everything else on the main service.
+
+There is no preload_app: gevent patches the standard library when the worker
+starts, and app.py has to be imported after that so its locks, queues and
+sockets are the cooperative versions.
+"""
+
+import os
+
+# Gunicorn binds to $PORT on its own when it is set (Render does this).
+workers = int(os.environ.get("STREAM_CONCURRENCY", 1))
+worker_class = "gevent"
+# Open connections per worker, streams included.
+worker_connections = int(os.environ.get("STREAM_WORKER_CONNECTIONS", 2000))
+
+# app.py reads this at import; leave some connections for other requests.
+os.environ.setdefault("STREAM_MAX_PER_WORKER", str(worker_connections - 100))
+
+timeout = 30
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    # psycopg2 waits on its socket in C, which would block every greenlet in
+    # the worker. This makes it wait through gevent instead.
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
@@ -0,0 +1,591 @@
+"""
+Background jobs for Solo Project 3 — Workout Log Manager.
+
+This module is responsible for:
+- Enqueueing jobs into the `jobs` table (created in `db.init_db`)
+- Claiming them from worker processes with `FOR UPDATE SKIP LOCKED`, so any
+  number of workers can poll the same table without handing out a job twice
+- Progress reporting, cancellation, and retries with backoff
+- Handing running jobs back to the queue when a worker is told to stop
+- Deleting finished jobs' stored output, and eventually the jobs themselves
+
+Handlers are plain functions registered with `@job_handler("kind")`. They get a
+`JobContext` and the job's payload, and return a JSON-serializable result.
+Calling `ctx.progress(...)` both records progress and is where cancellation
+is noticed. Handlers that commit work in several transactions record how far
+they got with `ctx.save_checkpoint(conn, ...)` inside each one, and read
+`ctx.checkpoint` on a retry to skip what is already done.
+
+Workers run outside the web process: `flask --app app jobs-worker`. On
+SIGTERM (e.g. a deploy) a worker stops at its job's next progress report or
+checkpoint and requeues it without using up an attempt; a job that doesn't
+get there within SHUTDOWN_GRACE_SECONDS is requeued and the worker exits
+anyway.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from psycopg2.extras import Json
+
+from db import configure_pool, with_connection
+
+
+logger = logging.getLogger(__name__)
+
+# Jobs move queued -> running -> succeeded | failed | cancelled; a failed
+# attempt with retries left goes back to queued.
+FINISHED_STATUSES = {"succeeded", "failed", "cancelled"}
+
+# Idle workers poll this often.
+POLL_SECONDS = 1.0
+# A running job whose worker has not reported progress for this long is assumed
+# dead and put back in the queue (counting as one of its attempts). Handlers
+# that can't report progress that often register a longer window.
+STALE_AFTER_SECONDS = 300
+# How often each worker sweeps for stale jobs.
+STALE_CHECK_SECONDS = 60
+# Retention: a succeeded job's stored output (export chunks) is kept this
+# long after it finishes, and finished jobs themselves this long. Output of
+# failed and cancelled jobs is deleted at the next sweep. Workers sweep this
+# often.
+OUTPUT_RETENTION_HOURS = 24
+JOB_RETENTION_DAYS = 7
+RETENTION_CHECK_SECONDS = 10 * 60
+# Retry delay is RETRY_BASE_SECONDS * 2 ** (attempt - 1).
+RETRY_BASE_SECONDS = 10
+# Each worker process runs one job at a time: a connection or two for the
+# handler plus one for progress updates. The request-sized default pool
+# (see db.py) would be wasted here.
+WORKER_POOL_MIN = 1
+WORKER_POOL_MAX = 4
+# After SIGTERM, how long a worker waits for its job to reach a progress report
+# or checkpoint before requeueing it and exiting. Keep it under the platform's
+# kill deadline (Render sends SIGKILL 30 seconds after SIGTERM).
+SHUTDOWN_GRACE_SECONDS = 20
+
+JOB_COLUMNS = """
+    id, kind, payload, status, progress, attempts, max_attempts,
+    cancel_requested, result, error, run_after, created_at, updated_at
+"""
+
+_handlers: Dict[str, Callable[["JobContext", dict], Any]] = {}
+_stale_after: Dict[str, int] = {}
+
+# Set in a worker process once it has been told to stop.
+_shutdown = threading.Event()
+# (job_id, attempt) of the job this worker process is running, if any.
+_current_job: Optional[tuple] = None
+
+
+class JobCancelled(Exception):
+    """Raised from `JobContext.progress` when cancellation was requested."""
+
+
+class JobFailed(Exception):
+    """Raise from a handler to fail the job without retrying (e.g. bad payload)."""
+
+
+class JobInterrupted(Exception):
+    """
+    Raised from `JobContext` when the worker is shutting down; the job goes
+    back to the queue without counting the attempt.
+    """
+
+
+class JobLost(Exception):
+    """
+    Raised from `JobContext` when this attempt no longer owns the job: it was
+    presumed dead and requeued (and possibly claimed by another worker).
+    """
+
+
+def job_handler(kind: str, stale_after: int = STALE_AFTER_SECONDS):
+    """
+    Register a function as the handler for jobs of `kind`. A job that goes
+    `stale_after` seconds without a progress report is presumed dead.
+    """
+
+    def decorator(fn):
+        _handlers[kind] = fn
+        _stale_after[kind] = stale_after
+        return fn
+
+    return decorator
+
+
+def job_kinds() -> list:
+    return sorted(_handlers)
+
+
+def job_row_to_dict(row) -> dict:
+    """Convert a row selected with JOB_COLUMNS into the API's JSON shape."""
+    (
+        jid,
+        kind,
+        payload,
+        status,
+        progress,
+        attempts,
+        max_attempts,
+        cancel_requested,
+        result,
+        error,
+        run_after,
+        created_at,
+        updated_at,
+    ) = row
+
+    return {
+        "id": jid,
+        "kind": kind,
+        "payload": payload,
+        "status": status,
+        "progress": round(progress, 3),
+        "attempts": attempts,
+        "maxAttempts": max_attempts,
+        "cancelRequested": cancel_requested,
+        "result": result,
+        "error": error,
+        "runAfter": run_after.isoformat(),
+        "createdAt": created_at.isoformat(),
+        "updatedAt": updated_at.isoformat(),
+    }
+
+
+def enqueue_job(kind: str, payload: dict, max_attempts: int = 3) -> dict:
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO jobs (kind, payload, max_attempts, stale_after_seconds)
+                VALUES (%s, %s, %s, %s)
+                RETURNING {JOB_COLUMNS};
+                """,
+                (kind, Json(payload), max_attempts, _stale_after.get(kind, STALE_AFTER_SECONDS)),
+            )
+            return job_row_to_dict(cur.fetchone())
+
+    return with_connection(_inner)
+
+
+def get_job(job_id: int) -> Optional[dict]:
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s;", (job_id,))
+            row = cur.fetchone()
+            return job_row_to_dict(row) if row else None
+
+    return with_connection(_inner)
+
+
+def cancel_job(job_id: int) -> Optional[dict]:
+    """
+    Cancel a job. Queued jobs are cancelled immediately; running jobs are
+    flagged and stop at their next progress report. Finished jobs are
+    returned unchanged. Returns None if the job does not exist.
+    """
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE jobs
+                SET
+                    status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                    cancel_requested = (status = 'running'),
+                    updated_at = NOW()
+                WHERE id = %s AND status IN ('queued', 'running')
+                RETURNING {JOB_COLUMNS};
+                """,
+                (job_id,),
+            )
+            row = cur.fetchone()
+            if row:
+                return job_row_to_dict(row)
+            cur.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s;", (job_id,))
+            row = cur.fetchone()
+            return job_row_to_dict(row) if row else None
+
+    return with_connection(_inner)
+
+
+class JobContext:
+    """
+    Handed to handlers for progress reporting and cancellation checks.
+
+    `attempt` is the job's `attempts` value when this worker claimed it and
+    acts as a lock token: once the job is requeued and claimed again, the
+    count moves on and this context's updates stop matching.
+    """
+
+    def __init__(self, job_id: int, attempt: int, checkpoint: Optional[dict] = None):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.checkpoint = checkpoint
+
+    def progress(self, fraction: float) -> None:
+        """
+        Record progress (0.0–1.0) and refresh the job's lock so it is not
+        reclaimed as stale. Raises JobCancelled if cancellation was requested,
+        JobLost if this attempt no longer owns the job, and JobInterrupted if
+        the worker is shutting down.
+        """
+        if _shutdown.is_set():
+            raise JobInterrupted()
+
+        def _inner(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE jobs
+                    SET progress = %s, locked_at = NOW(), updated_at = NOW()
+                    WHERE id = %s AND status = 'running' AND attempts = %s
+                    RETURNING cancel_requested;
+                    """,
+                    (max(0.0, min(1.0, fraction)), self.job_id, self.attempt),
+                )
+                return cur.fetchone()
+
+        row = with_connection(_inner)
+        if row is None:
+            raise JobLost()
+        if row[0]:
+            raise JobCancelled()
+
+    def save_checkpoint(self, conn, checkpoint: dict, fraction: float) -> None:
+        """
+        Record `checkpoint` and progress on the handler's own connection, so
+        they commit or roll back together with the work they describe.
+
+        Only applies while this attempt still owns the job (the `attempts`
+        value it was claimed with); otherwise raises JobLost, and the
+        handler's transaction rolls back. Raises JobCancelled if cancellation
+        was requested, which also rolls back the current transaction, and
+        JobInterrupted if the worker is shutting down (the next attempt redoes
+        the work since the last committed checkpoint).
+        """
+        if _shutdown.is_set():
+            raise JobInterrupted()
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET checkpoint = %s, progress = %s, locked_at = NOW(), updated_at = NOW()
+                WHERE id = %s AND status = 'running' AND attempts = %s
+                RETURNING cancel_requested;
+                """,
+                (Json(checkpoint), max(0.0, min(1.0, fraction)), self.job_id, self.attempt),
+            )
+            row = cur.fetchone()
+        if row is None:
+            raise JobLost()
+        if row[0]:
+            raise JobCancelled()
+
+
+def _claim_job() -> Optional[tuple]:
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1,
+                    locked_at = NOW(), updated_at = NOW()
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND run_after <= NOW()
+                    ORDER BY run_after, id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, kind, payload, attempts, max_attempts, checkpoint;
+                """
+            )
+            return cur.fetchone()
+
+    return with_connection(_inner)
+
+
+def _requeue_stale_jobs() -> None:
+    """
+    Take back running jobs whose worker has gone quiet. The lost attempt
+    counts, so a job that keeps killing its worker fails after max_attempts
+    instead of cycling forever.
+    """
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = CASE
+                        WHEN cancel_requested THEN 'cancelled'
+                        WHEN attempts >= max_attempts THEN 'failed'
+                        ELSE 'queued'
+                    END,
+                    error = CASE
+                        WHEN cancel_requested THEN error
+                        ELSE 'Worker stopped responding (attempt ' || attempts
+                             || ' of ' || max_attempts || ').'
+                    END,
+                    locked_at = NULL, updated_at = NOW()
+                WHERE status = 'running'
+                  AND locked_at < NOW() - make_interval(secs => stale_after_seconds)
+                RETURNING id, status;
+                """
+            )
+            for job_id, status in cur.fetchall():
+                logger.warning("Job %s stopped responding; now %s.", job_id, status)
+
+    with_connection(_inner)
+
+
+def _release_job(job_id: int, attempt: int) -> None:
+    """
+    Put a job this worker is giving up on at shutdown back in the queue, and
+    take back the attempt it used. The next claim reuses the same `attempts`
+    value as the lock token, which is safe because this attempt has stopped.
+    A job with cancellation requested is cancelled instead.
+    """
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END,
+                    attempts = CASE WHEN cancel_requested THEN attempts ELSE attempts - 1 END,
+                    run_after = NOW(), locked_at = NULL, updated_at = NOW()
+                WHERE id = %s AND status = 'running' AND attempts = %s;
+                """,
+                (job_id, attempt),
+            )
+            return cur.rowcount
+
+    if with_connection(_inner):
+        logger.info("Job %s attempt %d handed back to the queue at shutdown.", job_id, attempt)
+
+
+def _prune_finished_jobs() -> None:
+    """
+    Apply the retention rules above. Succeeded jobs whose output is deleted
+    get `"expired": true` in their result so downloads can say so. Deleting
+    a job deletes its output with it (ON DELETE CASCADE).
+    """
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                WITH expired AS (
+                    UPDATE jobs
+                    SET result = COALESCE(result, '{}'::jsonb) || '{"expired": true}'::jsonb
+                    WHERE status = 'succeeded'
+                      AND updated_at < NOW() - make_interval(hours => %s)
+                      AND EXISTS (SELECT 1 FROM job_export_chunks c WHERE c.job_id = jobs.id)
+                    RETURNING id
+                )
+                DELETE FROM job_export_chunks
+                WHERE job_id IN (SELECT id FROM expired)
+                   OR job_id IN (SELECT id FROM jobs WHERE status IN ('failed', 'cancelled'));
+                """,
+                (OUTPUT_RETENTION_HOURS,),
+            )
+            chunks = cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM jobs
+                WHERE status IN ('succeeded', 'failed', 'cancelled')
+                  AND updated_at < NOW() - make_interval(days => %s);
+                """,
+                (JOB_RETENTION_DAYS,),
+            )
+            if chunks or cur.rowcount:
+                logger.info(
+                    "Retention sweep deleted %d output chunk(s) and %d job(s).",
+                    chunks,
+                    cur.rowcount,
+                )
+
+    with_connection(_inner)
+
+
+def _finish_job(
+    job_id: int, attempt: int, status: str, result=None, error=None, retry_in=None
+) -> None:
+    """Record an attempt's outcome, unless the job has since been taken back."""
+
+    def _inner(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET
+                    status = %s,
+                    progress = CASE WHEN %s = 'succeeded' THEN 1 ELSE progress END,
+                    result = %s,
+                    error = %s,
+                    run_after = NOW() + make_interval(secs => %s),
+                    locked_at = NULL,
+                    updated_at = NOW()
+                WHERE id = %s AND status = 'running' AND attempts = %s;
+                """,
+                (
+                    status,
+                    status,
+                    Json(result) if result is not None else None,
+                    error,
+                    retry_in or 0,
+                    job_id,
+                    attempt,
+                ),
+            )
+            return cur.rowcount
+
+    if not with_connection(_inner):
+        logger.warning(
+            "Job %s attempt %d finished as %s after losing its claim; discarded.",
+            job_id,
+            attempt,
+            status,
+        )
+
+
+def run_one_job() -> bool:
+    """Claim and run a single job. Returns False if nothing was runnable."""
+    claimed = _claim_job()
+    if not claimed:
+        return False
+
+    global _current_job
+    job_id, kind, payload, attempt, max_attempts, checkpoint = claimed
+    handler = _handlers.get(kind)
+    if handler is None:
+        _finish_job(job_id, attempt, "failed", error=f"No handler for job kind '{kind}'.")
+        return True
+
+    _current_job = (job_id, attempt)
+    try:
+        result = handler(JobContext(job_id, attempt, checkpoint), payload or {})
+    except JobInterrupted:
+        _release_job(job_id, attempt)
+    except JobLost:
+        logger.warning("Job %s (%s) attempt %d lost its claim; abandoning it.", job_id, kind, attempt)
+    except JobCancelled:
+        _finish_job(job_id, attempt, "cancelled")
+    except JobFailed as exc:
+        _finish_job(job_id, attempt, "failed", error=str(exc))
+    except Exception as exc:
+        logger.exception("Job %s (%s) attempt %d failed.", job_id, kind, attempt)
+        if attempt < max_attempts:
+            retry_in = RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+            _finish_job(job_id, attempt, "queued", error=str(exc), retry_in=retry_in)
+        else:
+            _finish_job(job_id, attempt, "failed", error=str(exc))
+    else:
+        _finish_job(job_id, attempt, "succeeded", result=result)
+    finally:
+        _current_job = None
+    return True
+
+
+def worker_loop() -> None:
+    """Run jobs until told to shut down; used as the body of each worker process."""
+    logger.info("Job worker %d started.", os.getpid())
+    last_stale_check = 0.0
+    last_retention_check = 0.0
+    while not _shutdown.is_set():
+        try:
+            if time.monotonic() - last_stale_check > STALE_CHECK_SECONDS:
+                _requeue_stale_jobs()
+                last_stale_check = time.monotonic()
+            if time.monotonic() - last_retention_check > RETENTION_CHECK_SECONDS:
+                _prune_finished_jobs()
+                last_retention_check = time.monotonic()
+            if not run_one_job():
+                _shutdown.wait(POLL_SECONDS)
+        except Exception:
+            # Database blip: back off and keep the worker alive.
+            logger.exception("Job worker %d hit an error; retrying.", os.getpid())
+            _shutdown.wait(POLL_SECONDS * 5)
+    logger.info("Job worker %d stopped.", os.getpid())
+
+
+def _wait_for_sigterm() -> None:
+    """
+    Watcher thread: on SIGTERM, ask the worker loop to stop, then give the
+    running job SHUTDOWN_GRACE_SECONDS to reach a progress report. A job
+    still running after that (stuck in one long query, say) is requeued from
+    here and the process exits without waiting for it.
+    """
+    signal.sigwait({signal.SIGTERM})
+    logger.info("Job worker %d shutting down.", os.getpid())
+    _shutdown.set()
+    time.sleep(SHUTDOWN_GRACE_SECONDS)
+    job = _current_job
+    if job is not None:
+        try:
+            _release_job(*job)
+        except Exception:
+            logger.exception("Could not requeue job %s at shutdown.", job[0])
+    os._exit(0)
+
+
+def _worker_main() -> None:
+    # Children inherit the supervisor's signal handlers. SIGTERM is blocked
+    # and taken by a watcher thread instead of a handler, because a Python
+    # handler only runs between bytecodes and a long query would hold it off
+    # past the grace period. Ctrl-C is left to the supervisor.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+    threading.Thread(target=_wait_for_sigterm, name="jobs-shutdown", daemon=True).start()
+    configure_pool(WORKER_POOL_MIN, WORKER_POOL_MAX)
+    worker_loop()
+
+
+def run_workers(concurrency: int) -> None:
+    """
+    Start `concurrency` worker processes and supervise them, restarting any
+    that exit, until this process receives SIGINT/SIGTERM. Workers then get
+    SHUTDOWN_GRACE_SECONDS (plus a little for the requeue) to hand their jobs
+    back before they are killed.
+
+    Workers are forked explicitly, whatever the platform's default start
+    method: handlers are registered when the app module is imported, and
+    only a forked child inherits that registry. Under "spawn" or
+    "forkserver" (the Linux default from Python 3.14) it would be empty.
+    """
+    processes: list = []
+    context = multiprocessing.get_context("fork")
+
+    def spawn():
+        proc = context.Process(target=_worker_main, name="jobs-worker", daemon=True)
+        proc.start()
+        return proc
+
+    def shutdown(signum, frame):
+        for proc in processes:
+            proc.terminate()
+        deadline = time.monotonic() + SHUTDOWN_GRACE_SECONDS + 5
+        for proc in processes:
+            proc.join(timeout=max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.kill()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    processes.extend(spawn() for _ in range(concurrency))
+    while True:
+        time.sleep(POLL_SECONDS)
+        for i, proc in enumerate(processes):
+            if not proc.is_alive():
+                logger.warning("Job worker %s exited; restarting.", proc.pid)
+                processes[i] = spawn()
@@ -0,0 +1,133 @@
+"""
+Response serializers for Solo Project 3 — Workout Log Manager.
+
+This module is responsible for:
+- Turning `workouts` rows (cursor tuples) into the JSON shapes the API returns
+- The compact alternatives: a columnar layout (one array per field) and
+  MessagePack encoding, both chosen by the client
+
+Full rows are in WORKOUT_COLUMNS order:
+(id, workout_date, exercise_type, duration_min, intensity, calories_burned, notes, image_url)
+Projected rows (`fields=`) hold just the selected fields, in WORKOUT_FIELDS order.
+"""
+
+import msgpack
+
+
+WORKOUT_COLUMNS = (
+    "id, workout_date, exercise_type, duration_min, intensity, calories_burned, notes, image_url"
+)
+
+# Columns a client supplies on insert: WORKOUT_COLUMNS minus the generated id
+INSERT_COLUMNS = WORKOUT_COLUMNS.split(", ", 1)[1]
+
+# API field names, in WORKOUT_COLUMNS order
+WORKOUT_FIELDS = (
+    "id",
+    "date",
+    "exerciseType",
+    "duration",
+    "intensity",
+    "caloriesBurned",
+    "notes",
+    "imageUrl",
+)
+
+# API field -> column, for sparse field projection (`fields=`)
+FIELD_COLUMNS = dict(zip(WORKOUT_FIELDS, (c.strip() for c in WORKOUT_COLUMNS.split(","))))
+
+MSGPACK_MIMETYPE = "application/msgpack"
+
+
+def workout_params(workout: dict) -> tuple:
+    """Column values for a validated workout, in INSERT_COLUMNS order."""
+    return (
+        workout["date"],
+        workout["exerciseType"],
+        workout["duration"],
+        workout["intensity"],
+        workout["caloriesBurned"],
+        workout["notes"],
+        workout["imageUrl"],
+    )
+
+
+def _identity(value):
+    return value
+
+
+# Per-field conversion from DB value to API value
+FIELD_CONVERTERS = {field: _identity for field in WORKOUT_FIELDS}
+FIELD_CONVERTERS["date"] = lambda d: d.isoformat()
+FIELD_CONVERTERS["notes"] = lambda n: n or ""
+
+
+def select_columns(fields):
+    """SELECT list for the given API fields."""
+    return ", ".join(FIELD_COLUMNS[f] for f in fields)
+
+
+def row_to_workout(row):
+    """
+    Convert a DB row from `workouts` into the JSON shape used by the frontend.
+    Expected row order:
+    (id, workout_date, exercise_type, duration_min, intensity, calories_burned, notes, image_url)
+    """
+    (
+        wid,
+        workout_date,
+        exercise_type,
+        duration_min,
+        intensity,
+        calories_burned,
+        notes,
+        image_url,
+    ) = row
+
+    return {
+        "id": wid,
+        "date": workout_date.isoformat(),
+        "exerciseType": exercise_type,
+        "duration": duration_min,
+        "intensity": intensity,
+        "caloriesBurned": calories_burned,
+        "notes": notes or "",
+        "imageUrl": image_url,
+    }
+
+
+def row_to_fields(row, fields):
+    """Like row_to_workout, for a projected row holding just `fields`."""
+    return {f: FIELD_CONVERTERS[f](v) for f, v in zip(fields, row)}
+
+
+def rows_to_columnar(rows, fields=WORKOUT_FIELDS):
+    """
+    Build the columnar payload straight from cursor tuples: one array per
+    field, all the same length, instead of one object per row. Skips the
+    per-row dicts entirely, and each key appears once rather than once per row.
+    """
+    if not rows:
+        return {field: [] for field in fields}
+
+    result = {}
+    for field, values in zip(fields, zip(*rows)):
+        convert = FIELD_CONVERTERS[field]
+        result[field] = list(values) if convert is _identity else [convert(v) for v in values]
+    return result
+
+
+def encode_workouts(rows, fmt, fields=WORKOUT_FIELDS):
+    """
+    Encode rows holding `fields` as a list of objects (fmt "rows") or
+    columnar (fmt "columnar").
+    """
+    if fmt == "columnar":
+        return rows_to_columnar(rows, fields)
+    if tuple(fields) == WORKOUT_FIELDS:
+        return [row_to_workout(r) for r in rows]
+    return [row_to_fields(r, fields) for r in rows]
+
+
+def to_msgpack(payload) -> bytes:
+    return msgpack.packb(payload, use_bin_type=True)
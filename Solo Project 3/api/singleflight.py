@@ -0,0 +1,119 @@
+"""
+Single-flight request coalescing for Solo Project 3 — Workout Log Manager.
+
+When several requests ask for the same read at the same time (e.g. a burst of
+dashboards loading the default first page and stats), only the first one runs
+the query. The others wait for it and share its result.
+
+Only callers that overlap with an in-flight query share it; nothing is cached
+once the query finishes. Overlap alone isn't enough for freshness, though: a
+read that arrives just after a write commits could join a query that started
+before the commit and get the older result. So the coalescer also has a write
+epoch, and calls only share a result within one epoch. Writers call
+`bump_epoch()` after committing, before they respond, and any later read in
+this process starts a fresh query.
+
+The epoch is per process. The API also bumps it from the change feed
+listener on every committed change, so writes made by other workers or the
+jobs worker end sharing too, once their notification arrives (usually a few
+milliseconds after the commit). A read in that gap can still join an older
+query, so clients that must see their own write right away skip coalescing
+for that read (the API's `fresh=1` param).
+
+This uses threading primitives only. That covers gunicorn's gthread/sync
+workers directly, and gevent/eventlet workers too, since they monkey-patch
+`threading` into cooperative locks and events.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Hashable, Optional
+
+
+def make_key(shape: str, params: dict) -> tuple:
+    """
+    Build a coalescing key from a query shape name and its parameters.
+
+    Params are sorted so dict order doesn't matter, and values are turned into
+    strings so the key stays hashable whatever the param types are.
+    """
+    return (shape, tuple(sorted((name, str(value)) for name, value in params.items())))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+
+    Results are shared between every caller of the same key (within one
+    write epoch), so callers must treat them as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._calls: dict = {}
+        self._executed: dict = defaultdict(int)
+        self._coalesced: dict = defaultdict(int)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Return fn(), or the result of an identical call already in flight."""
+        shape = key[0] if isinstance(key, tuple) and key else key
+        with self._lock:
+            flight_key = (self._epoch, key)
+            call = self._calls.get(flight_key)
+            if call is not None:
+                self._coalesced[shape] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[flight_key] = call
+                self._executed[shape] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[flight_key]
+            call.done.set()
+
+    def bump_epoch(self) -> None:
+        """
+        Call after committing a write: queries already in flight may predate
+        it, so later callers stop joining them.
+        """
+        with self._lock:
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        """Per-shape counts of queries run vs. callers that shared a result."""
+        with self._lock:
+            shapes = set(self._executed) | set(self._coalesced)
+            result = {}
+            for shape in sorted(shapes):
+                executed = self._executed[shape]
+                coalesced = self._coalesced[shape]
+                total = executed + coalesced
+                result[shape] = {
+                    "executed": executed,
+                    "coalesced": coalesced,
+                    "coalescedRatio": round(coalesced / total, 3) if total else 0,
+                }
+            return result
@@ -0,0 +1,300 @@
+"""
+Group-commit write queue for Solo Project 3 — Workout Log Manager.
+
+This module is responsible for:
+- Accepting already-validated workouts from request handlers
+- Collecting them into batches (every `flush_ms` or `max_rows`, whichever
+  comes first)
+- Writing each batch with one multi-row INSERT and one commit, so many
+  requests share a single fsync instead of paying for one each
+
+Callers get a `PendingWrite` back. Waiting on its future gives the same
+durability as a direct insert (the row is committed); not waiting trades that
+for latency: `stop()` flushes whatever is still queued on a graceful
+shutdown, but the write is lost if the process crashes or is killed before
+the flush.
+
+Each write's outcome is also recorded in the `pending_writes` table, in the
+same transaction as its batch, so its status can be looked up from any
+process once the batch has flushed. Before that, only the process that
+accepted the write knows about it.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db import with_connection
+from serializers import INSERT_COLUMNS, WORKOUT_COLUMNS, workout_params
+
+
+logger = logging.getLogger(__name__)
+
+# pending_writes rows older than this are deleted, checked at most this often
+PENDING_RETENTION_SECONDS = 24 * 60 * 60
+PENDING_PRUNE_INTERVAL_SECONDS = 10 * 60
+# How often an idle flusher wakes up to check whether stop() was called.
+STOP_POLL_SECONDS = 0.2
+
+
+class PendingWrite:
+    """A queued insert. `future` resolves to the created row once committed."""
+
+    def __init__(self, workout: dict):
+        self.pending_id = uuid.uuid4().hex
+        self.workout = workout
+        self.future: Future = Future()
+
+
+class WriteQueue:
+    """
+    Batches inserts into `table` on a background flusher thread.
+
+    The thread is started lazily by the first `submit`, so each gunicorn worker
+    gets its own after the fork. `row_to_result` converts a RETURNING row into
+    whatever the caller wants back (the API passes `row_to_workout`).
+    `on_commit`, if given, runs after each batch commits and before any of
+    its callers are released. `stop()` drains the queue and ends the thread;
+    call it on shutdown, since the thread is a daemon and would otherwise be
+    killed with writes still queued.
+    """
+
+    def __init__(
+        self,
+        row_to_result: Callable[[tuple], Any],
+        table: str = "workouts",
+        status_table: str = "pending_writes",
+        flush_ms: int = 2,
+        max_rows: int = 200,
+        max_queued: int = 10000,
+        max_tracked: int = 10000,
+        on_commit: Optional[Callable[[], None]] = None,
+    ):
+        self.row_to_result = row_to_result
+        self.table = table
+        self.status_table = status_table
+        self.flush_seconds = flush_ms / 1000.0
+        self.max_rows = max_rows
+        self.max_queued = max_queued
+        self.max_tracked = max_tracked
+        self.on_commit = on_commit
+        self._queue: "queue.Queue[PendingWrite]" = queue.Queue(maxsize=max_queued)
+        self._tracked: "OrderedDict[str, PendingWrite]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = threading.Event()
+        self.batches_flushed = 0
+        self.rows_flushed = 0
+        self._last_prune = 0.0
+
+    def start(self) -> None:
+        """Start the flusher thread for this process if it is not running."""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Anything inherited across a fork belongs to the parent.
+                self._queue = queue.Queue(maxsize=self.max_queued)
+                self._tracked.clear()
+                self._stopping = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="write-queue-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, workout: dict) -> PendingWrite:
+        """
+        Queue a validated workout for the next batch.
+
+        Raises queue.Full when the queue is at capacity, or once `stop()` has
+        been called, so the caller can fall back to a direct insert.
+        """
+        self.start()
+        pending = PendingWrite(workout)
+        with self._lock:
+            # Checked under the lock so nothing is queued after stop() has
+            # started draining.
+            if self._stopping.is_set():
+                raise queue.Full
+            self._queue.put_nowait(pending)
+            self._tracked[pending.pending_id] = pending
+            while len(self._tracked) > self.max_tracked:
+                self._tracked.popitem(last=False)
+        return pending
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Stop accepting writes, flush everything already queued and wait up to
+        `timeout` seconds for the flusher to exit. Safe to call more than once
+        and from processes that never started a flusher.
+        """
+        with self._lock:
+            self._stopping.set()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is None or not thread.is_alive():
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(
+                "Write queue still flushing after %.0fs; %d queued write(s) may be lost",
+                timeout,
+                self._queue.qsize(),
+            )
+
+    def lookup(self, pending_id: str) -> Optional[PendingWrite]:
+        """Find a write submitted to this process by its pending id."""
+        with self._lock:
+            return self._tracked.get(pending_id)
+
+    def lookup_status(self, pending_id: str) -> Optional[tuple]:
+        """
+        Return (status, error, result) for a flushed write from any process,
+        or None if no outcome has been recorded for it (yet). `result` is
+        None for failed writes and for rows deleted since.
+        """
+        columns = ", ".join(f"w.{c}" for c in WORKOUT_COLUMNS.split(", "))
+
+        def _inner(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT p.status, p.error, {columns}
+                    FROM {self.status_table} p
+                    LEFT JOIN {self.table} w ON w.id = p.workout_id
+                    WHERE p.pending_id = %s;
+                    """,
+                    (pending_id,),
+                )
+                return cur.fetchone()
+
+        row = with_connection(_inner)
+        if not row:
+            return None
+        status, error, workout_row = row[0], row[1], row[2:]
+        result = self.row_to_result(workout_row) if workout_row[0] is not None else None
+        return status, error, result
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "batchesFlushed": self.batches_flushed,
+            "rowsFlushed": self.rows_flushed,
+        }
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = [self._queue.get(timeout=STOP_POLL_SECONDS)]
+            except queue.Empty:
+                # submit() refuses new writes once stopping, so an empty queue
+                # here means everything has been flushed.
+                if self._stopping.is_set():
+                    return
+                continue
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+            if time.monotonic() - self._last_prune > PENDING_PRUNE_INTERVAL_SECONDS:
+                self._prune_statuses()
+
+    def _insert_rows(self, conn, batch: list) -> list:
+        with conn.cursor() as cur:
+            # Postgres returns rows from a multi-row VALUES insert in VALUES
+            # order, which is what lets us match results back to callers.
+            rows = execute_values(
+                cur,
+                f"INSERT INTO {self.table} ({INSERT_COLUMNS}) VALUES %s "
+                f"RETURNING {WORKOUT_COLUMNS};",
+                [workout_params(p.workout) for p in batch],
+                page_size=len(batch),
+                fetch=True,
+            )
+            execute_values(
+                cur,
+                f"INSERT INTO {self.status_table} (pending_id, status, workout_id) VALUES %s;",
+                [(p.pending_id, "committed", row[0]) for p, row in zip(batch, rows)],
+                page_size=len(batch),
+            )
+            return rows
+
+    def _fail(self, batch: list, error: str) -> None:
+        """Record `batch` as failed (best effort) and release its callers."""
+
+        def _inner(conn):
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO {self.status_table} (pending_id, status, error) VALUES %s "
+                    "ON CONFLICT (pending_id) DO NOTHING;",
+                    [(p.pending_id, "failed", error) for p in batch],
+                    page_size=len(batch),
+                )
+
+        try:
+            with_connection(_inner)
+        except Exception:
+            logger.exception("Could not record %d failed writes.", len(batch))
+        for pending in batch:
+            pending.future.set_exception(RuntimeError(error))
+
+    def _prune_statuses(self) -> None:
+        def _inner(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"DELETE FROM {self.status_table} "
+                    "WHERE created_at < NOW() - make_interval(secs => %s);",
+                    (PENDING_RETENTION_SECONDS,),
+                )
+
+        try:
+            with_connection(_inner)
+        except Exception:
+            logger.exception("Pruning %s failed.", self.status_table)
+        self._last_prune = time.monotonic()
+
+    def _flush(self, batch: list) -> None:
+        try:
+            rows = with_connection(lambda conn: self._insert_rows(conn, batch))
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            if len(batch) == 1:
+                logger.exception("Queued workout insert failed.")
+                self._fail(batch, "Workout insert failed.")
+                return
+            # One bad row fails the whole statement; retry individually so it
+            # only takes itself down.
+            logger.exception("Batch insert of %d workouts failed; retrying one by one.", len(batch))
+            for pending in batch:
+                self._flush([pending])
+            return
+        except Exception:
+            # Connection, pool or server trouble affects every row alike.
+            # Retrying row by row would only make one slow attempt per row
+            # against a database that is down, so fail the batch at once.
+            logger.exception("Batch insert of %d workouts failed.", len(batch))
+            self._fail(batch, "Database unavailable; workout not saved.")
+            return
+
+        self.batches_flushed += 1
+        self.rows_flushed += len(rows)
+        if self.on_commit:
+            self.on_commit()
+        for pending, row in zip(batch, rows):
+            pending.future.set_result(self.row_to_result(row))
@@ -2,6 +2,9 @@
 SQL-backed CRUD, images, search/filtering, sorting, and configurable paging with cookie. */
 
 const API_BASE = (typeof window !== 'undefined' && window.API_BASE_URL) ? window.API_BASE_URL.replace(/\/$/, '') : '';
+// The change stream can be served by a separate service (see DEPLOYMENT.md);
+// without one it comes from the API itself.
+const STREAM_BASE = (typeof window !== 'undefined' && window.STREAM_BASE_URL) ? window.STREAM_BASE_URL.replace(/\/$/, '') : API_BASE;
 
 // Paging configuration (must match backend constraints)
 const PAGE_SIZE_MIN = 5;
@@ -18,6 +21,21 @@ let currentPageSize = DEFAULT_PAGE_SIZE;
 let editingId = null;
 let deleteId = null;
 
+// Rows currently shown in the table, patched in place by the change feed
+let currentWorkouts = [];
+let currentStats = null;
+let changeStream = null;
+// Wait before re-opening the change stream after the server turns it away
+const STREAM_RECONNECT_MS = 30000;
+let refreshTimer = null;
+// Ids this tab just wrote. Their change events are skipped once, since the
+// fresh reload after our own write already shows them.
+const ownWriteIds = new Set();
+const OWN_WRITE_TTL_MS = 10000;
+// Writes this tab has in flight, and the ids of change events skipped meanwhile
+let writesInFlight = 0;
+const skippedWhileWriting = new Set();
+
 // Search / filter / sort state
 let currentSearch = '';
 let currentExerciseTypeFilter = '';
@@ -95,20 +113,15 @@ function formatDate(dateString) {
     return d.toLocaleDateString('en-US', { year: 'numeric', month: 'short', day: 'numeric' });
 }
 
-async function loadStats() {
-    try {
-        const stats = await api('/api/stats');
-        document.getElementById('totalWorkouts').textContent = stats.totalWorkouts;
-        document.getElementById('totalMinutes').textContent = stats.totalMinutes;
-        document.getElementById('totalCalories').textContent = stats.totalCalories;
-        document.getElementById('avgDuration').textContent = stats.avgDuration;
-        document.getElementById('mostCommonType').textContent = stats.mostCommonType;
-        // Stats view also shows the current page size (driven from client state)
-        const pageSizeEl = document.getElementById('currentPageSize');
-        if (pageSizeEl) pageSizeEl.textContent = currentPageSize;
-    } catch (e) {
-        console.error('Stats load failed', e);
-    }
+function renderStats(stats) {
+    document.getElementById('totalWorkouts').textContent = stats.totalWorkouts;
+    document.getElementById('totalMinutes').textContent = stats.totalMinutes;
+    document.getElementById('totalCalories').textContent = stats.totalCalories;
+    document.getElementById('avgDuration').textContent = stats.avgDuration;
+    document.getElementById('mostCommonType').textContent = stats.mostCommonType;
+    // Stats view also shows the current page size (driven from client state)
+    const pageSizeEl = document.getElementById('currentPageSize');
+    if (pageSizeEl) pageSizeEl.textContent = currentPageSize;
 }
 
 function updatePageSizeDisplay() {
@@ -122,7 +135,44 @@ function updateSortDirLabel() {
     btn.textContent = currentSortDir === 'asc' ? 'Asc ↑' : 'Desc ↓';
 }
 
-async function loadPage(page) {
+function renderWorkouts() {
+    const tbody = document.getElementById('workoutTableBody');
+    tbody.innerHTML = '';
+    if (currentWorkouts.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="8" style="text-align: center;">No workouts match the current filters. Add one or adjust your search.</td></tr>';
+    } else {
+        currentWorkouts.forEach(w => {
+            const row = document.createElement('tr');
+            const intensityClass = (w.intensity || '').toLowerCase().replace(/\s/g, '');
+            const imgSrc = w.imageUrl || PLACEHOLDER_IMAGE;
+            row.innerHTML = `
+                <td>
+                    <div class="image-cell">
+                        <img src="${imgSrc}"
+                             alt="Workout image"
+                             class="workout-image-thumb"
+                             onerror="this.onerror=null;this.src='${PLACEHOLDER_IMAGE}';">
+                    </div>
+                </td>
+                <td>${formatDate(w.date)}</td>
+                <td>${w.exerciseType}</td>
+                <td>${w.duration}</td>
+                <td><span class="intensity-badge ${intensityClass}">${w.intensity}</span></td>
+                <td>${w.caloriesBurned}</td>
+                <td>${w.notes ? (w.notes.substring(0, 30) + (w.notes.length > 30 ? '...' : '')) : '-'}</td>
+                <td>
+                    <button class="btn btn-success" type="button" data-edit-id="${w.id}">Edit</button>
+                    <button class="btn btn-danger" type="button" data-delete-id="${w.id}">Delete</button>
+                </td>
+            `;
+            tbody.appendChild(row);
+        });
+    }
+}
+
+// `fresh` skips the server's read coalescing; pass it right after our own
+// write so the reload can't come back from a query that started before it.
+async function loadPage(page, fresh = false) {
     if (page < 1) page = 1;
 
     // Build query string with paging, search, filters, and sorting
@@ -134,9 +184,11 @@ async function loadPage(page) {
     if (currentIntensityFilter) params.set('intensity', currentIntensityFilter);
     params.set('sortBy', currentSortBy);
     params.set('sortDir', currentSortDir);
+    if (fresh) params.set('fresh', '1');
 
     try {
-        const result = await api(`/api/workouts?${params.toString()}`);
+        // Page, paging info, and stats come back together in one request
+        const result = await api(`/api/dashboard?${params.toString()}`);
         const workouts = result.workouts || [];
         totalRecords = result.total || 0;
         totalPages = result.totalPages || 1;
@@ -145,40 +197,14 @@ async function loadPage(page) {
             currentPageSize = result.pageSize;
         }
         updatePageSizeDisplay();
-
-        const tbody = document.getElementById('workoutTableBody');
-        tbody.innerHTML = '';
-        if (workouts.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="8" style="text-align: center;">No workouts match the current filters. Add one or adjust your search.</td></tr>';
-        } else {
-            workouts.forEach(w => {
-                const row = document.createElement('tr');
-                const intensityClass = (w.intensity || '').toLowerCase().replace(/\s/g, '');
-                const imgSrc = w.imageUrl || PLACEHOLDER_IMAGE;
-                row.innerHTML = `
-                    <td>
-                        <div class="image-cell">
-                            <img src="${imgSrc}"
-                                 alt="Workout image"
-                                 class="workout-image-thumb"
-                                 onerror="this.onerror=null;this.src='${PLACEHOLDER_IMAGE}';">
-                        </div>
-                    </td>
-                    <td>${formatDate(w.date)}</td>
-                    <td>${w.exerciseType}</td>
-                    <td>${w.duration}</td>
-                    <td><span class="intensity-badge ${intensityClass}">${w.intensity}</span></td>
-                    <td>${w.caloriesBurned}</td>
-                    <td>${w.notes ? (w.notes.substring(0, 30) + (w.notes.length > 30 ? '...' : '')) : '-'}</td>
-                    <td>
-                        <button class="btn btn-success" type="button" data-edit-id="${w.id}">Edit</button>
-                        <button class="btn btn-danger" type="button" data-delete-id="${w.id}">Delete</button>
-                    </td>
-                `;
-                tbody.appendChild(row);
-            });
+        if (result.stats) {
+            currentStats = result.stats;
+            renderStats(currentStats);
         }
 
+        currentWorkouts = workouts;
+        renderWorkouts();
+
         const prevBtn = document.getElementById('prevPage');
         const nextBtn = document.getElementById('nextPage');
         const indicator = document.getElementById('pageIndicator');
@@ -192,6 +218,136 @@ async function loadPage(page) {
     }
 }
 
+// Re-fetch the current page at most once per burst of remote changes
+function scheduleRefresh() {
+    if (refreshTimer) return;
+    refreshTimer = setTimeout(() => {
+        refreshTimer = null;
+        loadPage(currentPage);
+    }, 500);
+}
+
+// Patch an edited row (and the totals it feeds) in place. Only done when the
+// edit cannot move the row in or out of the current filters, reorder the page,
+// or change the most common type; everything else falls back to a refresh.
+function patchUpdatedRow(row) {
+    const idx = currentWorkouts.findIndex(w => w.id === row.id);
+    if (idx === -1 || !currentStats || currentSearch) return false;
+    const old = currentWorkouts[idx];
+    if (old.exerciseType !== row.exerciseType || old.intensity !== row.intensity) return false;
+    const sortKey = { date: 'date', duration: 'duration', calories: 'caloriesBurned' }[currentSortBy];
+    if (old[sortKey] !== row[sortKey]) return false;
+
+    currentStats.totalMinutes += row.duration - old.duration;
+    currentStats.totalCalories += row.caloriesBurned - old.caloriesBurned;
+    if (currentStats.totalWorkouts > 0) {
+        currentStats.avgDuration = Math.round(currentStats.totalMinutes / currentStats.totalWorkouts);
+    }
+    currentWorkouts[idx] = row;
+    renderStats(currentStats);
+    renderWorkouts();
+    return true;
+}
+
+// True when a row cannot be on the current page: it fails the exercise type
+// or intensity filter.
+function outsideFilters(row) {
+    return Boolean(
+        (currentExerciseTypeFilter && row.exerciseType !== currentExerciseTypeFilter) ||
+        (currentIntensityFilter && row.intensity !== currentIntensityFilter)
+    );
+}
+
+// Fold an insert (sign 1) or delete (sign -1) into the stats panel, which
+// covers every workout whatever the filters. The next reload replaces these
+// numbers with the server's.
+function patchStatsForRow(row, sign) {
+    if (!currentStats || !currentStats.exerciseTypeCounts) return false;
+    const stats = currentStats;
+    stats.totalWorkouts += sign;
+    stats.totalMinutes += sign * row.duration;
+    stats.totalCalories += sign * row.caloriesBurned;
+    stats.avgDuration = stats.totalWorkouts > 0 ? Math.round(stats.totalMinutes / stats.totalWorkouts) : 0;
+    stats.avgCalories = stats.totalWorkouts > 0 ? Math.round(stats.totalCalories / stats.totalWorkouts) : 0;
+
+    const counts = stats.exerciseTypeCounts;
+    counts[row.exerciseType] = (counts[row.exerciseType] || 0) + sign;
+    if (counts[row.exerciseType] <= 0) delete counts[row.exerciseType];
+    // Same tie-break as the server: highest count, then name
+    let mostCommon = 'N/A';
+    Object.keys(counts).forEach(type => {
+        if (mostCommon === 'N/A' || counts[type] > counts[mostCommon] ||
+            (counts[type] === counts[mostCommon] && type < mostCommon)) {
+            mostCommon = type;
+        }
+    });
+    stats.mostCommonType = mostCommon;
+    renderStats(stats);
+    return true;
+}
+
+function applyChange(change) {
+    if (ownWriteIds.delete(change.id)) return;
+    if (writesInFlight > 0) {
+        // Possibly our own write, before its response has told us the id.
+        // The reload after the write covers it either way.
+        skippedWhileWriting.add(change.id);
+        return;
+    }
+    if (change.op === 'update') {
+        if (change.row && patchUpdatedRow(change.row)) return;
+    } else if (change.row && outsideFilters(change.row)) {
+        // Not on this page and not in its total; only the stats move.
+        if (patchStatsForRow(change.row, change.op === 'insert' ? 1 : -1)) return;
+    }
+    // Everything else can shift paging, so fold it into one debounced refresh.
+    scheduleRefresh();
+}
+
+// Run one of this tab's writes. `idOf` picks the written id out of the
+// response so its change event can be skipped if it hasn't arrived yet. If
+// the write fails there is no reload to cover skipped events, so refresh.
+async function runOwnWrite(request, idOf) {
+    writesInFlight++;
+    try {
+        const result = await request();
+        const id = idOf(result);
+        if (id != null && !skippedWhileWriting.has(id)) {
+            ownWriteIds.add(id);
+            setTimeout(() => ownWriteIds.delete(id), OWN_WRITE_TTL_MS);
+        }
+        return result;
+    } catch (err) {
+        if (skippedWhileWriting.size > 0) scheduleRefresh();
+        throw err;
+    } finally {
+        writesInFlight--;
+        if (writesInFlight === 0) skippedWhileWriting.clear();
+    }
+}
+
+function connectChangeStream() {
+    if (typeof EventSource === 'undefined' || changeStream) return;
+    changeStream = new EventSource(STREAM_BASE + '/api/workouts/stream');
+    changeStream.addEventListener('change', (e) => {
+        try {
+            applyChange(JSON.parse(e.data));
+        } catch (err) {
+            console.error('Bad change event', err);
+        }
+    });
+    changeStream.addEventListener('reset', scheduleRefresh);
+    changeStream.addEventListener('error', () => {
+        // EventSource retries dropped connections itself, but gives up for
+        // good on an error response (e.g. 503 when the server's stream slots
+        // are full). Try again later; the page still works without live updates.
+        if (changeStream.readyState === EventSource.CLOSED) {
+            changeStream = null;
+            setTimeout(connectChangeStream, STREAM_RECONNECT_MS);
+        }
+    });
+}
+
 function resetForm() {
     document.getElementById('workoutForm').reset();
     document.getElementById('formTitle').textContent = 'Add New Workout';
@@ -236,13 +392,13 @@ function hideDeleteConfirm() {
 async function confirmDelete() {
     if (!deleteId) return;
     try {
-        await api(`/api/workouts/${deleteId}`, { method: 'DELETE' });
+        const id = deleteId;
+        await runOwnWrite(() => api(`/api/workouts/${id}`, { method: 'DELETE' }), () => id);
         hideDeleteConfirm();
         let page = currentPage;
         if (totalRecords <= 1) page = 1;
         else if (currentPage > 1 && (currentPage - 1) * currentPageSize >= totalRecords - 1) page = currentPage - 1;
-        await loadPage(page);
-        await loadStats();
+        await loadPage(page, true);
     } catch (e) {
         showFormError(e.message || 'Delete failed.');
     }
@@ -293,14 +449,19 @@ async function handleFormSubmit(e) {
 
     try {
         if (editingId) {
-            await api(`/api/workouts/${editingId}`, { method: 'PUT', body: JSON.stringify(payload) });
+            await runOwnWrite(
+                () => api(`/api/workouts/${editingId}`, { method: 'PUT', body: JSON.stringify(payload) }),
+                saved => saved && saved.id
+            );
         } else {
-            await api('/api/workouts', { method: 'POST', body: JSON.stringify(payload) });
+            await runOwnWrite(
+                () => api('/api/workouts', { method: 'POST', body: JSON.stringify(payload) }),
+                saved => saved && saved.id
+            );
         }
         resetForm();
         const pageToLoad = editingId ? currentPage : 1;
-        await loadPage(pageToLoad);
-        await loadStats();
+        await loadPage(pageToLoad, true);
     } catch (err) {
         const msg = (err.data && err.data.error) || err.message || 'Request failed.';
         showFormError(msg);
@@ -406,7 +567,7 @@ async function init() {
     setDefaultImageUrl();
     attachEventListeners();
     await loadPage(1);
-    await loadStats();
+    connectChangeStream();
 }
 
 document.addEventListener('DOMContentLoaded', init);